@@ -16,19 +16,27 @@
 # under the License.
 # pylint: disable=invalid-name, no-member, too-many-locals, too-many-arguments, too-many-statements, singleton-comparison, unused-argument, no-else-return
 """Sort related operators """
+import functools
+import math
+
 import tvm
 from tvm import te
 from tvm._ffi import get_global_func
 
 from .injective import schedule_injective_from_existing
-from ..math import identity
-from ..transform import strided_slice, transpose
+from ..math import cast, identity
+from ..transform import reshape, strided_slice, take
 from .. import tag
 
 
-def swap(arr, axis):
-    """ swap arr[axis] and arr[-1] """
-    return arr[:axis] + [arr[-1]] + arr[axis + 1 : -1] + [arr[axis]]
+def _can_use_thrust():
+    """Check if sorting can be offloaded to thrust under the current target.
+
+    The thrust wrappers are only valid for CUDA; other GPU targets
+    (e.g. Vulkan) have to fall back to the IR based sort kernels.
+    """
+    target = tvm.target.Target.current(allow_none=True)
+    return target is not None and target.kind.name == "cuda" and is_thrust_available()
 
 
 def _schedule_sort(outs):
@@ -47,23 +55,33 @@ def _schedule_sort(outs):
     """
     outs = [outs] if isinstance(outs, te.tensor.Tensor) else outs
     s = te.create_schedule([x.op for x in outs])
-    scheduled_ops = []
-
-    def traverse(op):
+    # Iterative traversal with a visited set: the recursive version
+    # re-walked shared subtrees and did a linear scan over a list for
+    # every membership test, which gets slow on large fused graphs.
+    scheduled_ops = set()
+    stack = [out.op for out in outs]
+    while stack:
+        op = stack.pop()
+        if op in scheduled_ops:
+            continue
+        scheduled_ops.add(op)
         if tag.is_injective(op.tag):
             schedule_injective_from_existing(s, op.output(0))
         for tensor in op.input_tensors:
-            if tensor.op.input_tensors and tensor.op not in scheduled_ops:
-                traverse(tensor.op)
-        scheduled_ops.append(op)
-
-    for out in outs:
-        traverse(out.op)
+            if tensor.op.input_tensors:
+                stack.append(tensor.op)
     return s
 
 
 def sort_ir(
-    data, values_out, values_out_swap, axis, is_ascend, indices_out=None, indices_out_swap=None
+    data,
+    values_out,
+    values_out_swap,
+    axis,
+    is_ascend,
+    indices_out=None,
+    indices_out_swap=None,
+    topk=None,
 ):
     """Low level IR to do nms sorting on the GPU, same usage as tvm.contrib.sort.argsort on the CPU.
 
@@ -90,6 +108,13 @@ def sort_ir(
     indices_out_swap : Buffer
         Output buffer of indices with same shape as data to use as swap.
 
+    topk : Int, optional
+        Only the first topk elements along the axis are required to be
+        sorted. When given, each merge pass only merges the first topk
+        elements of every sorted run, since nothing beyond that can reach
+        the first topk positions of the result. Elements past topk in the
+        output buffers are left unspecified.
+
     Returns
     -------
     stmt : Stmt
@@ -122,59 +147,207 @@ def sort_ir(
 
     # Set up threading
     max_threads = int(tvm.target.Target.current(allow_none=False).max_num_threads)
+    static_len = None
+    if isinstance(shape[axis], (int, tvm.tir.IntImm)):
+        static_len = int(shape[axis])
+
+    # A full-width block is mostly idle warps for short static axes, so
+    # shrink it to the next power of two covering the axis, never below a
+    # warp. An axis that fits one block then sorts entirely in the block
+    # sort stage without any global merge passes.
     nthread_tx = max_threads
-    nthread_bx = ceil_div(shape[axis], max_threads)
+    if static_len is not None and static_len > 1:
+        nthread_tx = min(max_threads, max(1 << int(math.ceil(math.log2(static_len))), 32))
+    elif static_len is not None:
+        nthread_tx = 32
+    nthread_bx = ceil_div(shape[axis], nthread_tx)
     nthread_by = axis_mul_before
     nthread_bz = axis_mul_after
 
-    # Copy the data to initial output
+    # The block sort stage below sorts runs of block_elems elements, the
+    # global merge passes handle the remaining levels.
+    block_elems = 2 * nthread_tx
+    log2_block_elems = int(math.log2(block_elems))
+    assert 2 ** log2_block_elems == block_elems, "block size must be a power of two"
+
+    # When the axis length is static we know up front how many merge passes
+    # will run and therefore which buffer the final pass writes. If that
+    # count is odd, start the ping-pong from the swap buffer instead, so the
+    # sorted result always lands in the real output and no trailing
+    # copy-back kernel is needed.
+    if static_len is not None:
+        static_lim = max(int(math.ceil(math.log2(static_len))), 0) if static_len > 1 else 0
+        if max(static_lim - log2_block_elems, 0) % 2 == 1:
+            values_out, values_out_swap = values_out_swap, values_out
+            if indices_out is not None:
+                indices_out, indices_out_swap = indices_out_swap, indices_out
+
+    # Use 32-bit loop counters and merge coordinates whenever the axis
+    # length is statically known to fit; 64-bit indexing costs extra
+    # registers and instructions on the GPU and is only kept as the
+    # dynamic-shape fallback.
+    idx_dtype = "int64"
+    if static_len is not None and static_len < 2 ** 31:
+        idx_dtype = "int32"
+
+    ## The first log2(block_elems) levels of the merge sort fit entirely within
+    ## one thread block, so they are done in a single kernel that sorts a tile
+    ## of the axis in shared memory with odd-even transposition sort. Only the
+    ## remaining levels go through the global memory merge passes below.
     with ib.new_scope():
         tx = te.thread_axis("threadIdx.x")
         bx = te.thread_axis("blockIdx.x")
         ib.scope_attr(tx, "thread_extent", nthread_tx)
-        ib.scope_attr(bx, "thread_extent", nthread_bx)
-        tid = bx * nthread_tx + tx
+        ib.scope_attr(bx, "thread_extent", ceil_div(shape[axis], block_elems))
 
         by = te.thread_axis("blockIdx.y")
         bz = te.thread_axis("blockIdx.z")
         ib.scope_attr(by, "thread_extent", nthread_by)
         ib.scope_attr(bz, "thread_extent", nthread_bz)
-        idx = (by * shape[axis] + tid) * axis_mul_after + bz
-        with ib.if_scope(tid < shape[axis]):
-            values_out[idx] = data[idx]
-            if indices_out is not None:
-                indices_out[idx] = tvm.tir.generic.cast(tid, indices_out.dtype)
+
+        # Only the keys live in shared memory; they are the only values read
+        # by the comparisons. The indices stay in global memory and are only
+        # touched when a swap actually happens, which halves the shared
+        # memory footprint of the block for argsort.
+        temp_values = ib.allocate(
+            values_out.dtype, (block_elems,), name="temp_values", scope="shared"
+        )
+        temp_value = ib.allocate(values_out.dtype, (1,), name="temp_value", scope="local")
+        if indices_out is not None:
+            temp_index = ib.allocate(indices_out.dtype, (1,), name="temp_index", scope="local")
+
+        tile_base = bx * block_elems
+        tile_end = tvm.te.min(block_elems, shape[axis] - tile_base)
+
+        def tile_idx(i):
+            """Global index of element i of this block's tile"""
+            return (by * shape[axis] + tile_base + i) * axis_mul_after + bz
+
+        def sync():
+            ib.emit(tvm.tir.Call(None, "tir.tvm_storage_sync", tvm.runtime.convert(["shared"])))
+
+        # With a contiguous sort axis whose static length divides the
+        # vector width, the tile can move between global and shared memory
+        # with 128-bit vectorized accesses instead of one element at a time.
+        vec_width = 4
+        use_vec = (
+            axis_mul_after == 1
+            and static_len is not None
+            and static_len % vec_width == 0
+            and tvm.runtime.DataType(values_out.dtype).bits == 32
+        )
+
+        # Cooperatively load the tile straight from the input into shared
+        # memory with coalesced accesses, initializing the indices on the
+        # way, so no separate copy kernel is needed.
+        if use_vec:
+            with ib.if_scope(tx * vec_width < tile_end):
+                with ib.for_range(0, vec_width, for_type="vectorize") as v:
+                    temp_values[tx * vec_width + v] = data[tile_idx(tx * vec_width + v)]
+                    if indices_out is not None:
+                        indices_out[tile_idx(tx * vec_width + v)] = tvm.tir.generic.cast(
+                            tile_base + tx * vec_width + v, indices_out.dtype
+                        )
+        else:
+            for offset in [0, nthread_tx]:
+                with ib.if_scope(tx + offset < tile_end):
+                    temp_values[tx + offset] = data[tile_idx(tx + offset)]
+                    if indices_out is not None:
+                        indices_out[tile_idx(tx + offset)] = tvm.tir.generic.cast(
+                            tile_base + tx + offset, indices_out.dtype
+                        )
+        sync()
+
+        # Sort the tile with odd-even transposition sort. Only swapping on a
+        # strict inequality keeps the sort stable.
+        with ib.for_range(0, block_elems) as phase:
+            first = 2 * tx + tvm.tir.indexmod(phase, 2)
+            with ib.if_scope(first + 1 < tile_end):
+                if is_ascend:
+                    out_of_order = temp_values[first] > temp_values[first + 1]
+                else:
+                    out_of_order = temp_values[first] < temp_values[first + 1]
+                with ib.if_scope(out_of_order):
+                    temp_value[0] = temp_values[first]
+                    temp_values[first] = temp_values[first + 1]
+                    temp_values[first + 1] = temp_value[0]
+                    if indices_out is not None:
+                        temp_index[0] = indices_out[tile_idx(first)]
+                        indices_out[tile_idx(first)] = indices_out[tile_idx(first + 1)]
+                        indices_out[tile_idx(first + 1)] = temp_index[0]
+            sync()
+
+        # Write the sorted tile back
+        if use_vec:
+            with ib.if_scope(tx * vec_width < tile_end):
+                with ib.for_range(0, vec_width, for_type="vectorize") as v:
+                    values_out[tile_idx(tx * vec_width + v)] = temp_values[tx * vec_width + v]
+        else:
+            for offset in [0, nthread_tx]:
+                with ib.if_scope(tx + offset < tile_end):
+                    values_out[tile_idx(tx + offset)] = temp_values[tx + offset]
 
     ## we are looping over the array doing mergesort from the bottom up.
     ## The outer loop runs on the host and launches a cuda kernel for each iteration
-    ## of the algorithm.
-    ## The basic idea is that at iteration 0, each thread does sort on 2 elements.
-    ## On iteration 1, each thread merges 2 sorted arrays of 2 elements,
-    ## to deal with 4 total elements.
-    ## On iteration 2, each thread merges 2 sorted arrays of 4 elements,
-    ## to deal with 8 total elements. On iteration 3, each thread deals with 16 elements, etc
+    ## of the algorithm. A single persistent kernel with a grid-wide barrier
+    ## between levels would avoid the per-level launch overhead, but neither
+    ## the CUDA codegen nor the runtime supports grid-scope storage sync or
+    ## cooperative launch, so the kernel boundary is the only device-wide
+    ## barrier available; the block sort stage above already folds the first
+    ## log2(block_elems) levels into one launch.
+    ## The block sort above leaves sorted runs of block_elems elements, so at
+    ## iteration 0 each thread merges 2 sorted arrays of block_elems elements,
+    ## at iteration 1 each thread merges 2 sorted arrays of 2 * block_elems
+    ## elements, and so on.
     ## On the final iteration of the algorithm, one thread will merge two sorted lists
     ## to sort the entire array
     lim = tvm.tir.generic.cast(
-        tvm.tir.ceil(tvm.tir.log2(tvm.tir.generic.cast(shape[axis], "float64"))), "int64"
+        tvm.tir.ceil(tvm.tir.log2(tvm.tir.generic.cast(shape[axis], "float64"))), idx_dtype
     )
-    with ib.for_range(0, lim, dtype="int64") as l2_width:
+    mergepasses = tvm.te.max(lim - log2_block_elems, tvm.tir.const(0, idx_dtype))
+    # Number of outputs each thread produces per merge pass. With merge-path
+    # partitioning every thread does the same constant amount of work
+    # regardless of the run width, instead of one thread serially merging an
+    # entire pair of runs.
+    elements_per_thread = 8
+    with ib.for_range(0, mergepasses, dtype=idx_dtype) as merge_pass:
+        l2_width = merge_pass + log2_block_elems
         width = 2 << l2_width
         # Define and launch the cuda kernel
         with ib.new_scope():
-            i = ib.allocate("int64", (1,), name="i", scope="local")
-            j = ib.allocate("int64", (1,), name="j", scope="local")
-            start = ib.allocate("int64", (1,), name="start", scope="local")
-            middle = ib.allocate("int64", (1,), name="middle", scope="local")
-            end = ib.allocate("int64", (1,), name="end", scope="local")
+            i = ib.allocate(idx_dtype, (1,), name="i", scope="local")
+            j = ib.allocate(idx_dtype, (1,), name="j", scope="local")
+            lo = ib.allocate(idx_dtype, (1,), name="lo", scope="local")
+            hi = ib.allocate(idx_dtype, (1,), name="hi", scope="local")
+            step = ib.allocate(idx_dtype, (1,), name="step", scope="local")
+            # Stage the keys each block merges in shared memory so the
+            # binary searches and the merge itself stop issuing scattered
+            # global loads. A block produces block_out outputs and, by the
+            # merge-path invariant, consumes exactly block_out inputs, so
+            # that is the tile size; it only fits in shared memory for
+            # keys of at most 32 bits.
+            block_out = elements_per_thread * nthread_tx
+            stage_keys = tvm.runtime.DataType(values_out.dtype).bits <= 32
+            if stage_keys:
+                sh_keys = ib.allocate(
+                    values_out.dtype, (block_out,), name="sh_keys", scope="shared"
+                )
+                a0v = ib.allocate(idx_dtype, (1,), name="a0v", scope="local")
+                a1v = ib.allocate(idx_dtype, (1,), name="a1v", scope="local")
+                b0v = ib.allocate(idx_dtype, (1,), name="b0v", scope="local")
+                b1v = ib.allocate(idx_dtype, (1,), name="b1v", scope="local")
+                a_shift = ib.allocate(idx_dtype, (1,), name="a_shift", scope="local")
+                b_shift = ib.allocate(idx_dtype, (1,), name="b_shift", scope="local")
             tx = te.thread_axis("threadIdx.x")
             bx = te.thread_axis("blockIdx.x")
             ib.scope_attr(tx, "thread_extent", nthread_tx)
-            # Reduce the number of blocks as the work per thread grows
+            # The grid covers the whole axis at constant work per thread
             ib.scope_attr(
                 bx,
                 "thread_extent",
-                tvm.tir.generic.cast(ceil_div(shape[axis], width * max_threads), "int32"),
+                tvm.tir.generic.cast(
+                    ceil_div(shape[axis], elements_per_thread * nthread_tx), "int32"
+                ),
             )
             tid = bx * nthread_tx + tx
 
@@ -183,6 +356,9 @@ def sort_ir(
             ib.scope_attr(by, "thread_extent", nthread_by)
             ib.scope_attr(bz, "thread_extent", nthread_bz)
 
+            # The batch offset is invariant across the whole merge
+            base_idx = by * shape[axis] * axis_mul_after + bz
+
             def compare(a, b):
                 """
                 Compare a and b in proper ascending or descending order
@@ -193,67 +369,205 @@ def sort_ir(
                     out = b <= a
                 return out
 
-            def bottom_up_merge(source, dest, source_idx, dest_idx, start, middle, end, even):
+            def clamp_runs(seg_start, middle, end):
+                """Clamp both runs of a segment to their first topk elements"""
+                if topk is not None:
+                    k_bound = tvm.tir.const(topk, idx_dtype)
+                    return tvm.te.min(middle, seg_start + k_bound), tvm.te.min(
+                        end, middle + k_bound
+                    )
+                return middle, end
+
+            def sync():
+                ib.emit(tvm.tir.Call(None, "tir.tvm_storage_sync", tvm.runtime.convert(["shared"])))
+
+            def stage(source, size):
                 """
-                Merge the two sections of the array assigned to this thread
+                Cooperatively stage the keys feeding this block's outputs.
+
+                When the merge segments are no wider than the block's output
+                range, every segment the block touches lies entirely inside
+                that range and the inputs are just the matching contiguous
+                source slice. Otherwise the block sits inside a single
+                segment, and merge-path searches at its boundary diagonals
+                find the A and B slices its outputs draw from; those are
+                staged back to back. a_shift/b_shift translate global run
+                positions into shared tile slots for both layouts.
                 """
-                # pylint: disable=arguments-out-of-order
-                # initialize iterators
-                i[0] = start
-                j[0] = middle
-                # set up indexes
-                base_idx = by * shape[axis] * axis_mul_after + bz
-                # iterate over the output loop
-                with ib.for_range(0, end - start) as k:
-                    i_idx = base_idx + i[0] * axis_mul_after
-                    j_idx = base_idx + j[0] * axis_mul_after
-                    k_idx = base_idx + (k + start) * axis_mul_after
-
-                    def swap_values(source, dest, source_idx, dest_idx):
-                        def assign_i():
-                            """assign i value to current output"""
-                            dest[k_idx] = source[i_idx]
-                            if indices_out is not None:
-                                dest_idx[k_idx] = source_idx[i_idx]
-                            i[0] += 1
-
-                        def assign_j():
-                            """assign j value to current output"""
-                            dest[k_idx] = source[j_idx]
-                            if indices_out is not None:
-                                dest_idx[k_idx] = source_idx[j_idx]
-                            j[0] += 1
-
-                        ## if both of the iterators are in range
-                        with ib.if_scope(tvm.tir.all(i[0] < middle, j[0] < end)):
-                            # compare them and insert whichever is next into the output
-                            with ib.if_scope(compare(source[i_idx], source[j_idx])):
-                                assign_i()
+                const0 = tvm.tir.const(0, idx_dtype)
+                out0 = tvm.tir.generic.cast(bx, idx_dtype) * block_out
+                with ib.if_scope(width <= block_out):
+                    a_shift[0] = out0
+                    b_shift[0] = out0
+                    a0v[0] = const0
+                    b0v[0] = const0
+                    a1v[0] = width
+                    b1v[0] = width
+                    for s in range(elements_per_thread):
+                        slot = s * nthread_tx + tx
+                        with ib.if_scope(out0 + slot < size):
+                            sh_keys[slot] = source[base_idx + (out0 + slot) * axis_mul_after]
+                with ib.else_scope():
+                    seg_start = out0 - tvm.tir.indexmod(out0, width)
+                    middle = tvm.te.min(seg_start + tvm.tir.indexdiv(width, 2), size)
+                    end = tvm.te.min(seg_start + width, size)
+                    a_end, b_end = clamp_runs(seg_start, middle, end)
+                    a_len = a_end - seg_start
+                    b_len = b_end - middle
+                    total = a_len + b_len
+                    d0 = tvm.te.min(out0 - seg_start, total)
+                    d1 = tvm.te.min(d0 + block_out, total)
+                    # the searches are uniform across the block, so every
+                    # thread just runs them redundantly
+                    for diag, split in ((d0, a0v), (d1, a1v)):
+                        lo[0] = tvm.te.max(diag - b_len, const0)
+                        hi[0] = tvm.te.min(diag, a_len)
+                        with ib.for_range(0, l2_width + 1, dtype=idx_dtype):
+                            with ib.if_scope(lo[0] < hi[0]):
+                                mid = (lo[0] + hi[0]) >> 1
+                                a_val = source[base_idx + (seg_start + mid) * axis_mul_after]
+                                b_val = source[
+                                    base_idx + (middle + diag - 1 - mid) * axis_mul_after
+                                ]
+                                with ib.if_scope(compare(a_val, b_val)):
+                                    lo[0] = mid + 1
+                                with ib.else_scope():
+                                    hi[0] = mid
+                        split[0] = lo[0]
+                    b0v[0] = d0 - a0v[0]
+                    b1v[0] = d1 - a1v[0]
+                    a_shift[0] = seg_start + a0v[0]
+                    b_shift[0] = middle + b0v[0] - (a1v[0] - a0v[0])
+                    for s in range(elements_per_thread):
+                        slot = s * nthread_tx + tx
+                        with ib.if_scope(slot < d1 - d0):
+                            with ib.if_scope(slot < a1v[0] - a0v[0]):
+                                sh_keys[slot] = source[
+                                    base_idx + (a_shift[0] + slot) * axis_mul_after
+                                ]
                             with ib.else_scope():
-                                assign_j()
-                        # otherwise, simply copy the remainder of the valid iterator to the output
+                                sh_keys[slot] = source[
+                                    base_idx + (b_shift[0] + slot) * axis_mul_after
+                                ]
+                sync()
+
+            def bottom_up_merge(source, dest, source_idx, dest_idx, out_pos, middle, end):
+                """
+                Produce elements_per_thread outputs of the merge of the two
+                sorted runs around `middle`, starting at output position
+                out_pos. The starting coordinates in the two runs are found
+                with a merge-path binary search over the output diagonal, so
+                no thread ever walks a whole run serially.
+                """
+                # pylint: disable=arguments-out-of-order
+                seg_start = out_pos - tvm.tir.indexmod(out_pos, width)
+                diag = out_pos - seg_start
+                # For a top-k sort only the first topk elements of each run
+                # are meaningful, so clamp both runs and merge just the
+                # surviving prefixes; their merge contains the first topk
+                # elements of the full merge.
+                a_end, b_end = clamp_runs(seg_start, middle, end)
+                out_end = a_end + (b_end - middle)
+                const0 = tvm.tir.const(0, idx_dtype)
+                # Binary search for the merge-path split of this diagonal.
+                # The search window is at most width elements, so l2_width + 1
+                # halvings always converge. With staged keys the window is
+                # additionally pinned inside the block's staged slices; the
+                # true split lies there since the block-boundary splits
+                # bracket every thread's split.
+                if stage_keys:
+                    lo[0] = tvm.te.max(diag - tvm.te.min(b_end - middle, b1v[0]), a0v[0])
+                    hi[0] = tvm.te.min(tvm.te.min(diag - b0v[0], a1v[0]), a_end - seg_start)
+                else:
+                    lo[0] = tvm.te.max(diag - (b_end - middle), const0)
+                    hi[0] = tvm.te.min(diag, a_end - seg_start)
+                with ib.for_range(0, l2_width + 1, dtype=idx_dtype):
+                    with ib.if_scope(lo[0] < hi[0]):
+                        mid = (lo[0] + hi[0]) >> 1
+                        if stage_keys:
+                            a_val = sh_keys[seg_start + mid - a_shift[0]]
+                            b_val = sh_keys[middle + diag - 1 - mid - b_shift[0]]
+                        else:
+                            a_val = source[base_idx + (seg_start + mid) * axis_mul_after]
+                            b_val = source[base_idx + (middle + diag - 1 - mid) * axis_mul_after]
+                        # Ties go to the first run to keep the merge stable
+                        with ib.if_scope(compare(a_val, b_val)):
+                            lo[0] = mid + 1
                         with ib.else_scope():
-                            with ib.if_scope(i[0] < middle):
-                                assign_i()
-                            with ib.else_scope():
-                                assign_j()
+                            hi[0] = mid
+                # initialize iterators from the merge-path split
+                i[0] = seg_start + lo[0]
+                j[0] = middle + diag - lo[0]
+                # With staged keys an iterator is exhausted once it leaves the
+                # block's staged slice, not only at the end of its run: the
+                # outputs up to the block's upper split consume exactly the
+                # staged slices, so a side whose slice is spent can only lose
+                # from here on. Judging exhaustion against the full run would
+                # compare a clamped, already consumed key instead and let that
+                # side win again, derailing both iterators.
+                if stage_keys:
+                    a_lim = tvm.te.min(a_end, seg_start + a1v[0])
+                    b_lim = tvm.te.min(b_end, middle + b1v[0])
+                else:
+                    a_lim = a_end
+                    b_lim = b_end
+                # emit this thread's slice of the output
+                with ib.for_range(0, elements_per_thread, dtype=idx_dtype) as k:
+                    with ib.if_scope(out_pos + k < out_end):
+                        k_idx = base_idx + (out_pos + k) * axis_mul_after
+                        # clamp the reads so exhausted iterators stay in
+                        # bounds; take_i never picks an exhausted side
+                        i_idx = base_idx + tvm.te.min(i[0], a_end - 1) * axis_mul_after
+                        j_idx = base_idx + tvm.te.min(j[0], b_end - 1) * axis_mul_after
+                        if stage_keys:
+                            i_key = sh_keys[
+                                tvm.te.max(tvm.te.min(i[0], a_lim - 1) - a_shift[0], const0)
+                            ]
+                            j_key = sh_keys[
+                                tvm.te.max(tvm.te.min(j[0], b_lim - 1) - b_shift[0], const0)
+                            ]
+                        else:
+                            i_key = source[i_idx]
+                            j_key = source[j_idx]
+                        take_i = tvm.tir.all(
+                            i[0] < a_lim,
+                            tvm.tir.any(j[0] >= b_lim, compare(i_key, j_key)),
+                        )
+                        # emit the winner and advance the iterators with
+                        # selects instead of a divergent branch; warps stay
+                        # converged no matter how the merge interleaves.
+                        # take_i is latched into step before the iterators
+                        # move, since Select re-evaluates its condition.
+                        dest[k_idx] = tvm.tir.Select(take_i, i_key, j_key)
+                        if indices_out is not None:
+                            dest_idx[k_idx] = tvm.tir.Select(
+                                take_i, source_idx[i_idx], source_idx[j_idx]
+                            )
+                        step[0] = tvm.tir.Select(take_i, tvm.tir.const(1, idx_dtype), const0)
+                        i[0] += step[0]
+                        j[0] += tvm.tir.const(1, idx_dtype) - step[0]
 
-                    # Switch which input is the source and which is the destination each iteration
+            def mergesort(source, dest, source_idx, dest_idx, size, width, even):
+                if stage_keys:
+                    # staging is block-collective and contains a barrier, so
+                    # it runs before any per-thread bounds checks; `even` is
+                    # uniform across the block
                     with ib.if_scope(even):
-                        swap_values(source, dest, source_idx, dest_idx)
+                        stage(source, size)
                     with ib.else_scope():
-                        swap_values(dest, source, dest_idx, source_idx)
-
-            def mergesort(source, dest, source_idx, dest_idx, size, width, even):
-                # calculate the start, mid, and end points of this section
-                start[0] = width * tid
-                with ib.if_scope(start[0] < size):
-                    middle[0] = tvm.te.min(start[0] + tvm.tir.indexdiv(width, 2), size)
-                    end[0] = tvm.te.min(start[0] + width, size)
-                    ## merge the start->middle and middle->end arrays
-                    bottom_up_merge(
-                        source, dest, source_idx, dest_idx, start[0], middle[0], end[0], even
-                    )
+                        stage(dest, size)
+                # this thread's first output position along the axis
+                out_pos = tvm.tir.generic.cast(tid, idx_dtype) * elements_per_thread
+                with ib.if_scope(out_pos < size):
+                    seg_start = out_pos - tvm.tir.indexmod(out_pos, width)
+                    middle = tvm.te.min(seg_start + tvm.tir.indexdiv(width, 2), size)
+                    end = tvm.te.min(seg_start + width, size)
+                    # Switch which input is the source and which is the
+                    # destination each pass
+                    with ib.if_scope(even):
+                        bottom_up_merge(source, dest, source_idx, dest_idx, out_pos, middle, end)
+                    with ib.else_scope():
+                        bottom_up_merge(dest, source, dest_idx, source_idx, out_pos, middle, end)
 
             # Call the kernel
             mergesort(
@@ -263,28 +577,31 @@ def sort_ir(
                 indices_out_swap,
                 shape[axis],
                 width,
-                tvm.tir.indexmod(l2_width, 2) == 0,
+                tvm.tir.indexmod(merge_pass, 2) == 0,
             )
 
-    ## if the final sorted data ended up in the swap, copy it to the real output
-    with ib.if_scope(tvm.tir.indexmod(lim, 2) == 1):
-        with ib.new_scope():
-            tx = te.thread_axis("threadIdx.x")
-            bx = te.thread_axis("blockIdx.x")
-            ib.scope_attr(tx, "thread_extent", nthread_tx)
-            ib.scope_attr(bx, "thread_extent", nthread_bx)
-            tid = bx * nthread_tx + tx
-
-            by = te.thread_axis("blockIdx.y")
-            bz = te.thread_axis("blockIdx.z")
-            ib.scope_attr(by, "thread_extent", nthread_by)
-            ib.scope_attr(bz, "thread_extent", nthread_bz)
-            idx = (by * shape[axis] + tid) * axis_mul_after + bz
-            with ib.if_scope(tid < shape[axis]):
+    ## With a static axis length the buffers were arranged above so the final
+    ## pass always writes the real output. Only for a dynamic length can the
+    ## sorted data end up in the swap; copy it to the real output then.
+    if static_len is None:
+        with ib.if_scope(tvm.tir.indexmod(mergepasses, 2) == 1):
+            with ib.new_scope():
+                tx = te.thread_axis("threadIdx.x")
+                bx = te.thread_axis("blockIdx.x")
+                ib.scope_attr(tx, "thread_extent", nthread_tx)
+                ib.scope_attr(bx, "thread_extent", nthread_bx)
+                tid = bx * nthread_tx + tx
+
+                by = te.thread_axis("blockIdx.y")
+                bz = te.thread_axis("blockIdx.z")
+                ib.scope_attr(by, "thread_extent", nthread_by)
+                ib.scope_attr(bz, "thread_extent", nthread_bz)
                 idx = (by * shape[axis] + tid) * axis_mul_after + bz
-                values_out[idx] = values_out_swap[idx]
-                if indices_out is not None:
-                    indices_out[idx] = indices_out_swap[idx]
+                with ib.if_scope(tid < shape[axis]):
+                    idx = (by * shape[axis] + tid) * axis_mul_after + bz
+                    values_out[idx] = values_out_swap[idx]
+                    if indices_out is not None:
+                        indices_out[idx] = indices_out_swap[idx]
 
     return ib.get()
 
@@ -332,57 +649,138 @@ def sort_nms_ir(data, valid_count, output, axis, is_ascend):
     data = ib.buffer_ptr(data)
     valid_count = ib.buffer_ptr(valid_count)
     output = ib.buffer_ptr(output)
+
+    # When the axis statically fits in one thread block, the segment is
+    # sorted with a bitonic sort in shared memory, padded to the next power
+    # of two with sentinel keys. That takes O(log^2 N) barriers instead of
+    # the O(N) barriers of the odd-even transposition sort below.
+    padded_len = None
+    if isinstance(shape[axis], (int, tvm.tir.IntImm)) and 0 < int(shape[axis]) <= max_threads:
+        padded_len = 1 << max(int(math.ceil(math.log2(int(shape[axis])))), 1)
+
     nthread_tx = max_threads
-    nthread_bx = size // max_threads + 1
+    # one block can sort every segment on the shared memory path
+    nthread_bx = 1 if padded_len is not None else size // max_threads + 1
     tx = te.thread_axis("threadIdx.x")
     bx = te.thread_axis("blockIdx.x")
     ib.scope_attr(tx, "thread_extent", nthread_tx)
     ib.scope_attr(bx, "thread_extent", nthread_bx)
     tid = bx * nthread_tx + tx
-    temp_data = ib.allocate("float32", (1,), name="temp_data", scope="local")
+    temp_data = ib.allocate(data.dtype, (1,), name="temp_data", scope="local")
     temp_index = ib.allocate("int32", (1,), name="temp_index", scope="local")
-    is_ascend = tvm.tir.IntImm("int32", is_ascend)
+    if padded_len is not None:
+        temp_keys = ib.allocate(data.dtype, (padded_len,), name="temp_keys", scope="shared")
+        temp_idxs = ib.allocate("int32", (padded_len,), name="temp_idxs", scope="shared")
+    ascending = bool(is_ascend)
 
     idxd = tvm.tir.indexdiv
     idxm = tvm.tir.indexmod
 
+    def sync():
+        ib.emit(tvm.tir.Call(None, "tir.tvm_storage_sync", tvm.runtime.convert(["shared"])))
+
+    def compare_swap(up, first, second):
+        """Branchlessly exchange the shared pairs at first and second
+        when they are out of order for direction up.
+
+        The condition is built on the latched copy of the first key and
+        evaluated against the second slot before that slot is written, so
+        re-evaluating it per select stays consistent.
+        """
+        temp_data[0] = temp_keys[first]
+        temp_index[0] = temp_idxs[first]
+        out_of_order = tvm.tir.Select(
+            up, temp_data[0] > temp_keys[second], temp_data[0] < temp_keys[second]
+        )
+        temp_keys[first] = tvm.tir.Select(out_of_order, temp_keys[second], temp_data[0])
+        temp_idxs[first] = tvm.tir.Select(out_of_order, temp_idxs[second], temp_index[0])
+        temp_idxs[second] = tvm.tir.Select(out_of_order, temp_index[0], temp_idxs[second])
+        temp_keys[second] = tvm.tir.Select(out_of_order, temp_data[0], temp_keys[second])
+
+    def bitonic_sort(current_sort_num, base_idx):
+        """Sort the valid prefix of one segment in shared memory"""
+        # pad the tile with sentinel keys that sort past every valid key
+        sentinel = tvm.tir.max_value(data.dtype) if ascending else tvm.tir.min_value(data.dtype)
+        with ib.if_scope(tid < padded_len):
+            with ib.if_scope(tid < current_sort_num):
+                temp_keys[tid] = data[base_idx + tid * axis_mul_after]
+            with ib.else_scope():
+                temp_keys[tid] = sentinel
+            temp_idxs[tid] = tid
+        sync()
+        length = 2
+        while length <= padded_len:
+            half = length // 2
+            while half >= 1:
+                with ib.if_scope(tid < padded_len):
+                    other = tid ^ half
+                    with ib.if_scope(other > tid):
+                        # sort direction of this bitonic subsequence
+                        if ascending:
+                            up = (tid & length) == 0
+                        else:
+                            up = (tid & length) != 0
+                        compare_swap(up, tid, other)
+                sync()
+                half //= 2
+            length *= 2
+        with ib.if_scope(tid < current_sort_num):
+            data[base_idx + tid * axis_mul_after] = temp_keys[tid]
+            output[base_idx + tid * axis_mul_after] = temp_idxs[tid]
+        # the shared tile is reused by the next segment
+        sync()
+
+    def odd_even_transpose_sort(current_sort_num, base_idx):
+        """Sort the valid prefix of one segment in global memory"""
+        with ib.for_range(0, current_sort_num) as k:
+            with ib.if_scope(tid < idxd(current_sort_num + 1, 2)):
+                offset = base_idx + (2 * tid + idxm(k, 2)) * axis_mul_after
+                with ib.if_scope(2 * tid + idxm(k, 2) + 1 < current_sort_num):
+                    # The sort direction is resolved at build time and the
+                    # exchange itself is a run of selects, so the only
+                    # divergence left is the length bound above. The
+                    # condition is built on the latched copy of the first
+                    # element and the second slot is written last, so
+                    # re-evaluating it per select stays consistent.
+                    temp_data[0] = data[offset]
+                    temp_index[0] = output[offset]
+                    if ascending:
+                        out_of_order = temp_data[0] > data[offset + axis_mul_after]
+                    else:
+                        out_of_order = temp_data[0] < data[offset + axis_mul_after]
+                    data[offset] = tvm.tir.Select(
+                        out_of_order, data[offset + axis_mul_after], temp_data[0]
+                    )
+                    output[offset] = tvm.tir.Select(
+                        out_of_order, output[offset + axis_mul_after], temp_index[0]
+                    )
+                    output[offset + axis_mul_after] = tvm.tir.Select(
+                        out_of_order, temp_index[0], output[offset + axis_mul_after]
+                    )
+                    data[offset + axis_mul_after] = tvm.tir.Select(
+                        out_of_order, temp_data[0], data[offset + axis_mul_after]
+                    )
+            # The barrier is reached by every thread in the block: it sits
+            # outside the tid guards and the loop bound current_sort_num
+            # is uniform across the block. CodeGenCUDA lowers a shared
+            # scope storage sync directly to the aligned __syncthreads()
+            # barrier (see PrintStorageSync in codegen_cuda.cc), so no
+            # divergence-safe fallback is ever emitted here.
+            sync()
+
+    current_sort_num = ib.allocate(valid_count.dtype, (1,), name="current_sort_num", scope="local")
     with ib.for_range(0, axis_mul_before) as i:
         with ib.for_range(0, axis_mul_after) as j:
-            current_sort_num = valid_count[i * axis_mul_after + j]
+            # Cache the segment length in a register; every comparison below
+            # would otherwise re-read the same global value.
+            current_sort_num[0] = valid_count[i * axis_mul_after + j]
             base_idx = i * shape[axis] * axis_mul_after + j
             with ib.if_scope(tid < shape[axis]):
                 output[base_idx + tid * axis_mul_after] = tid
-            # OddEvenTransposeSort
-            with ib.for_range(0, current_sort_num) as k:
-                with ib.if_scope(tid < idxd(current_sort_num + 1, 2)):
-                    offset = base_idx + (2 * tid + idxm(k, 2)) * axis_mul_after
-                    with ib.if_scope(
-                        tvm.tir.all(
-                            is_ascend == 1,
-                            2 * tid + idxm(k, 2) + 1 < current_sort_num,
-                            data[offset] > data[offset + axis_mul_after],
-                        )
-                    ):
-                        temp_data[0] = data[offset]
-                        data[offset] = data[offset + axis_mul_after]
-                        data[offset + axis_mul_after] = temp_data[0]
-                        temp_index[0] = output[offset]
-                        output[offset] = output[offset + axis_mul_after]
-                        output[offset + axis_mul_after] = temp_index[0]
-                    with ib.if_scope(
-                        tvm.tir.all(
-                            is_ascend == 0,
-                            2 * tid + idxm(k, 2) + 1 < current_sort_num,
-                            data[offset] < data[offset + axis_mul_after],
-                        )
-                    ):
-                        temp_data[0] = data[offset]
-                        data[offset] = data[offset + axis_mul_after]
-                        data[offset + axis_mul_after] = temp_data[0]
-                        temp_index[0] = output[offset]
-                        output[offset] = output[offset + axis_mul_after]
-                        output[offset + axis_mul_after] = temp_index[0]
-                ib.emit(tvm.tir.Call(None, "tir.tvm_storage_sync", tvm.runtime.convert(["shared"])))
+            if padded_len is not None:
+                bitonic_sort(current_sort_num[0], base_idx)
+            else:
+                odd_even_transpose_sort(current_sort_num[0], base_idx)
 
     return ib.get()
 
@@ -416,10 +814,6 @@ def argsort_nms_thrust(data, valid_count, axis=-1, is_ascend=1, dtype="float32")
     ndim = len(data.shape)
     if axis < 0:
         axis = ndim + axis
-    if axis != ndim - 1:
-        # Prepare for sorting along axis -1.
-        axes = swap(list(range(ndim)), axis)
-        data = transpose(data, axes)
 
     data_buf = tvm.tir.decl_buffer(data.shape, data.dtype, "data_buf", data_alignment=8)
     valid_count_buf = tvm.tir.decl_buffer(
@@ -429,11 +823,13 @@ def argsort_nms_thrust(data, valid_count, axis=-1, is_ascend=1, dtype="float32")
         tvm.tir.decl_buffer(data.shape, data.dtype, "value_buf", data_alignment=8),
         tvm.tir.decl_buffer(data.shape, "int32", "indices_buf", data_alignment=8),
     ]
+    # the contrib function handles a non-innermost axis itself, so no
+    # transpose of the input or output is needed
     out = te.extern(
         [data.shape, data.shape],
         [data, valid_count],
         lambda ins, outs: tvm.tir.call_packed(
-            "tvm.contrib.thrust.sort_nms", ins[0], ins[1], outs[0], outs[1], is_ascend
+            "tvm.contrib.thrust.sort_nms", ins[0], ins[1], outs[0], outs[1], is_ascend, axis
         ),
         in_buffers=[data_buf, valid_count_buf],
         out_buffers=out_bufs,
@@ -442,10 +838,6 @@ def argsort_nms_thrust(data, valid_count, axis=-1, is_ascend=1, dtype="float32")
         tag="nms_argsort_gpu",
     )
 
-    if axis != ndim - 1:
-        axes = swap(list(range(ndim)), axis)
-        out = [transpose(o, axes) for o in out]
-
     return out[1]
 
 
@@ -469,6 +861,8 @@ def sort(data, axis=-1, is_ascend=1):
     out : tvm.te.Tensor
         The output of this function.
     """
+    if _can_use_thrust():
+        return sort_thrust(data, axis=axis, is_ascend=is_ascend)
     value_buf = tvm.tir.decl_buffer(data.shape, data.dtype, "value_buf", data_alignment=8)
     value_buf_swap = tvm.tir.decl_buffer(data.shape, data.dtype, "value_buf_swap", data_alignment=8)
     out = te.extern(
@@ -482,6 +876,37 @@ def sort(data, axis=-1, is_ascend=1):
     return out
 
 
+def _make_sort_extern(data, axis, is_ascend, indices_dtype="int32", k=0, name="sort_gpu"):
+    """Build the te.extern node calling the thrust sort kernel.
+
+    All thrust backed sorts share the same buffer plumbing; only the sort
+    axis, direction and optional top-k truncation differ. The contrib
+    function handles a non-innermost axis itself, so no transpose of the
+    input or output is needed. When k is a positive static int the outputs
+    are declared with length k along the sort axis and thrust only writes
+    the first k elements of every segment.
+    """
+    ndim = len(data.shape)
+    axis = ndim + axis if axis < 0 else axis
+    out_shape = list(data.shape)
+    if k > 0:
+        out_shape[axis] = k
+    data_buf = tvm.tir.decl_buffer(data.shape, data.dtype, "data_buf", data_alignment=8)
+    value_buf = tvm.tir.decl_buffer(out_shape, data.dtype, "value_buf", data_alignment=8)
+    indices_buf = tvm.tir.decl_buffer(out_shape, indices_dtype, "indices_buf", data_alignment=8)
+    return te.extern(
+        [out_shape, out_shape],
+        [data],
+        lambda ins, outs: tvm.tir.call_packed(
+            "tvm.contrib.thrust.sort", ins[0], outs[0], outs[1], is_ascend, axis, k
+        ),
+        in_buffers=[data_buf],
+        out_buffers=[value_buf, indices_buf],
+        name=name,
+        tag=name,
+    )
+
+
 def sort_thrust(data, axis=-1, is_ascend=1):
     """Performs sorting along the given axis and returns an array of
     sorted values with the same shape as the input data.
@@ -502,36 +927,10 @@ def sort_thrust(data, axis=-1, is_ascend=1):
     out : tvm.te.Tensor
         The output of this function.
     """
-    dtype = "float32"
-
-    ndim = len(data.shape)
-    axis = ndim + axis if axis < 0 else axis
-
-    if axis != ndim - 1:
-        # Prepare for sorting along axis -1.
-        axes = swap(list(range(ndim)), axis)
-        data = transpose(data, axes)
-
-    value_buf = tvm.tir.decl_buffer(data.shape, data.dtype, "value_buf", data_alignment=8)
-    indices_buf = tvm.tir.decl_buffer(data.shape, dtype, "out_buf", data_alignment=8)
-    out = te.extern(
-        [data.shape, data.shape],
-        [data],
-        ## TODO(mbrookhart): This thrust function is actually doing argsort, not sort
-        ## For performance, we should probably rename the contrib function and add
-        ## a pure sort
-        lambda ins, outs: tvm.tir.call_packed(
-            "tvm.contrib.thrust.sort", ins[0], outs[0], outs[1], is_ascend
-        ),
-        out_buffers=[value_buf, indices_buf],
-        name="sort_gpu",
-        tag="sort_gpu",
-    )[0]
-
-    if axis != ndim - 1:
-        axes = swap(list(range(ndim)), axis)
-        out = transpose(out, axes)
-    return out
+    ## TODO(mbrookhart): This thrust function is actually doing argsort, not sort
+    ## For performance, we should probably rename the contrib function and add
+    ## a pure sort
+    return _make_sort_extern(data, axis, is_ascend)[0]
 
 
 def argsort(data, valid_count=None, axis=-1, is_ascend=1, dtype="float32"):
@@ -560,6 +959,10 @@ def argsort(data, valid_count=None, axis=-1, is_ascend=1, dtype="float32"):
     out : tvm.te.Tensor
         The output of this function.
     """
+    if _can_use_thrust():
+        return argsort_thrust(
+            data, valid_count=valid_count, axis=axis, is_ascend=is_ascend, dtype=dtype
+        )
     if valid_count is not None:
         sorted_data = identity(data)
         sorted_data_buf = tvm.tir.decl_buffer(
@@ -584,8 +987,13 @@ def argsort(data, valid_count=None, axis=-1, is_ascend=1, dtype="float32"):
         value_swap_buf = tvm.tir.decl_buffer(
             data.shape, data.dtype, "value_swap_buf", data_alignment=8
         )
-        indices_buf = tvm.tir.decl_buffer(data.shape, dtype, "out_buf", data_alignment=8)
-        indices_swap_buf = tvm.tir.decl_buffer(data.shape, dtype, "out_swap_buf", data_alignment=8)
+        # sort with int32 indices and only cast to the requested dtype at
+        # the end; sorting float indices wastes bandwidth and breaks down
+        # past 2**24 elements
+        indices_buf = tvm.tir.decl_buffer(data.shape, "int32", "out_buf", data_alignment=8)
+        indices_swap_buf = tvm.tir.decl_buffer(
+            data.shape, "int32", "out_swap_buf", data_alignment=8
+        )
         out = te.extern(
             [data.shape, data.shape, data.shape, data.shape],
             [data],
@@ -602,6 +1010,8 @@ def argsort(data, valid_count=None, axis=-1, is_ascend=1, dtype="float32"):
             name="argsort_gpu",
             tag="argsort_gpu",
         )[1]
+        if dtype != "int32":
+            out = cast(out, dtype)
     return out
 
 
@@ -704,20 +1114,31 @@ def topk(data, k=1, axis=-1, ret_type="both", is_ascend=False, dtype="int64"):
         The computed result.
     """
     assert ret_type in ["both", "values", "indices"]
+    if _can_use_thrust():
+        return topk_thrust(
+            data, k=k, axis=axis, ret_type=ret_type, is_ascend=is_ascend, dtype=dtype
+        )
     ndim = len(data.shape)
     axis = axis + ndim if axis < 0 else axis
     assert 0 <= axis < ndim
+    # With a static positive k the merge passes only need to keep the first
+    # k elements of every run sorted, which prunes most of the global
+    # memory traffic when k is much smaller than the axis length.
+    partial_k = k if isinstance(k, int) and k > 0 else None
     values_buf = tvm.tir.decl_buffer(data.shape, data.dtype, "values_buf", data_alignment=8)
     values_swap_buf = tvm.tir.decl_buffer(
         data.shape, data.dtype, "values_swap_buf", data_alignment=8
     )
-    indices_buf = tvm.tir.decl_buffer(data.shape, dtype, "indices_buf", data_alignment=8)
-    indices_swap_buf = tvm.tir.decl_buffer(data.shape, dtype, "indies_swap_buf", data_alignment=8)
+    # sort with int32 indices and only cast to the requested dtype at the
+    # end; a 64-bit index payload would double the index traffic of every
+    # merge pass
+    indices_buf = tvm.tir.decl_buffer(data.shape, "int32", "indices_buf", data_alignment=8)
+    indices_swap_buf = tvm.tir.decl_buffer(data.shape, "int32", "indies_swap_buf", data_alignment=8)
     if ret_type == "values":
         output = te.extern(
             [data.shape, data.shape],
             [data],
-            lambda ins, outs: sort_ir(ins[0], outs[0], outs[1], axis, is_ascend),
+            lambda ins, outs: sort_ir(ins[0], outs[0], outs[1], axis, is_ascend, topk=partial_k),
             out_buffers=[values_buf, values_swap_buf],
             name="topk_gpu",
             tag="topk_gpu",
@@ -734,6 +1155,7 @@ def topk(data, k=1, axis=-1, ret_type="both", is_ascend=False, dtype="int64"):
                 is_ascend,
                 indices_out=outs[1],
                 indices_out_swap=outs[3],
+                topk=partial_k,
             ),
             out_buffers=[values_buf, indices_buf, values_swap_buf, indices_swap_buf],
             name="topk_gpu",
@@ -741,7 +1163,9 @@ def topk(data, k=1, axis=-1, ret_type="both", is_ascend=False, dtype="int64"):
         )[0:2]
     if isinstance(k, int) and k < 1:
         if ret_type == "indices":
-            return output[1]
+            return cast(output[1], dtype) if dtype != "int32" else output[1]
+        if ret_type == "both" and dtype != "int32":
+            return [output[0], cast(output[1], dtype)]
         return output
     beg = [0] * ndim
     end = []
@@ -755,12 +1179,16 @@ def topk(data, k=1, axis=-1, ret_type="both", is_ascend=False, dtype="int64"):
         values_out, indices_out = output
         values_out = strided_slice(values_out, beg, end, strides)
         indices_out = strided_slice(indices_out, beg, end, strides)
+        if dtype != "int32":
+            indices_out = cast(indices_out, dtype)
         output = [values_out, indices_out]
     elif ret_type == "values":
         output = [strided_slice(output, beg, end, strides)]
     else:  # ret_type == "indices"
-        indices_out = output[1]
-        output = [strided_slice(indices_out, beg, end, strides)]
+        indices_out = strided_slice(output[1], beg, end, strides)
+        if dtype != "int32":
+            indices_out = cast(indices_out, dtype)
+        output = [indices_out]
     return output
 
 
@@ -799,43 +1227,25 @@ def topk_thrust(data, k=1, axis=-1, ret_type="both", is_ascend=False, dtype="int
     ndim = len(data.shape)
     axis = ndim + axis if axis < 0 else axis
 
-    if axis != ndim - 1:
-        # Prepare for sorting along axis -1.
-        axes = swap(list(range(ndim)), axis)
-        data = transpose(data, axes)
-
-    data_buf = tvm.tir.decl_buffer(data.shape, data.dtype, "data_buf", data_alignment=8)
-    out_bufs = [
-        tvm.tir.decl_buffer(data.shape, data.dtype, "value_buf", data_alignment=8),
-        tvm.tir.decl_buffer(data.shape, dtype, "indices_buf", data_alignment=8),
-    ]
-
     is_ascend = 1 if is_ascend else 0
 
-    out = te.extern(
-        [data.shape, data.shape],
-        [data],
-        lambda ins, outs: tvm.tir.call_packed(
-            "tvm.contrib.thrust.sort", ins[0], outs[0], outs[1], is_ascend
-        ),
-        in_buffers=[data_buf],
-        out_buffers=out_bufs,
-        name="topk_gpu",
-        tag="topk_gpu",
-    )
-
     if isinstance(k, tvm.tir.IntImm):
         k = k.value
 
-    if not isinstance(k, int) or k > 0:
+    # With a static k thrust truncates the outputs itself, so the sorted
+    # tails are never written and no slice pass is needed. thrust sorts
+    # with int32 indices; cast to the requested dtype at the end.
+    static_k = k if isinstance(k, int) and k > 0 else 0
+    out = _make_sort_extern(data, axis, is_ascend, k=static_k, name="topk_gpu")
+
+    if not isinstance(k, int):
         beg = [0] * ndim
-        end = data.shape[:-1] + [k if isinstance(k, int) else tvm.te.size_var("dim")]
+        end = [tvm.te.size_var("dim") if i == axis else data.shape[i] for i in range(ndim)]
         strides = [1] * ndim
         out = [strided_slice(o, beg, end, strides) for o in out]
 
-    if axis != ndim - 1:
-        axes = swap(list(range(ndim)), axis)
-        out = [transpose(o, axes) for o in out]
+    if dtype != "int32" and ret_type != "values":
+        out = [out[0], cast(out[1], dtype)]
 
     if ret_type == "values":
         out = out[0]
@@ -862,7 +1272,39 @@ def schedule_topk(outs):
     return _schedule_sort(outs)
 
 
-def stable_sort_by_key_thrust(keys, values, for_scatter=False):
+# Dtype pairs with a monomorphized stable_sort_by_key registry entry.
+_SORT_DTYPE_SUFFIX = {"int32": "i32", "int64": "i64", "float32": "f32"}
+
+
+def _make_sort_bufs(shape, key_dtype, value_dtype):
+    """Declare the in/out buffers for the sort-by-key extern.
+
+    Buffers carry their own Vars, so every extern needs fresh declarations;
+    sharing them between sort nodes would alias the nodes once two of them
+    end up in one lowered function (scatter already composes a sort extern
+    with a scatter extern in a single graph).
+    """
+
+    def decl(dtype, name):
+        return tvm.tir.decl_buffer(shape, dtype, name, data_alignment=16, offset_factor=4)
+
+    return (
+        decl(key_dtype, "keys_buf"),
+        decl(value_dtype, "values_buf"),
+        decl(key_dtype, "keys_buf"),
+        decl(value_dtype, "values_buf"),
+    )
+
+
+def stable_sort_by_key_thrust(
+    keys,
+    values,
+    for_scatter=False,
+    in_place=False,
+    key_dtype=None,
+    hint="random",
+    assume_sorted=False,
+):
     """Sort values with respect to keys using thrust.
     Both keys and values will be sorted and returned.
     Sorting is done via stable sort, so relative ordering among
@@ -882,6 +1324,199 @@ def stable_sort_by_key_thrust(keys, values, for_scatter=False):
         The output keys (indices) are all positive.
         This option is introduced to optimize the scatter implementation.
 
+    in_place: bool, optional
+        If True, the input storage doubles as the radix sort's alternate
+        buffer, halving the scratch memory of the sort. The contents of
+        keys and values are clobbered, so this is only safe when this sort
+        is their sole consumer.
+
+    key_dtype: str, optional
+        Sort on keys narrowed to this dtype instead of their native one.
+        Radix sort cost scales with the key width, so narrowing int64 keys
+        whose range is known to fit in 32 bits roughly halves the key
+        stream's memory traffic. The narrowing must be lossless for the
+        key range; the returned keys are cast back to the original dtype.
+        Only "int32" narrowing is implemented; other dtypes raise
+        ValueError since the backends cannot sort them.
+
+    hint: str, optional
+        Expected ordering of the keys, one of "random", "nearly" or
+        "sorted". Anything other than "random" makes the extern probe the
+        keys with is_sorted first and skip the sort when they are already
+        in order, trading one streaming read pass for the whole sort in
+        the best case.
+
+    assume_sorted: bool, optional
+        The caller guarantees the keys are already in sorted order (after
+        the for_scatter fixup, when that is set). The inputs are then
+        returned unchanged with no extern dispatch or sort launch. With
+        for_scatter set the fixup still has to run, so the call degrades
+        to hint="sorted" and the extern skips the sort after a single
+        is_sorted pass.
+
+    Returns
+    -------
+    keys_sorted : tvm.te.Tensor
+        The sorted keys
+
+    values_sorted : tvm.te.Tensor
+        The values sorted with respect to the keys
+    """
+    length = keys.shape[0]
+    if isinstance(length, (int, tvm.tir.IntImm)) and int(length) <= 1 and not for_scatter:
+        # Sorting 0 or 1 elements is the identity; hand the inputs back
+        # untouched with no extern or kernel launch. A compute-op copy would
+        # break extern consumers: scatter is scheduled with schedule_extern,
+        # whose AutoInlineInjective removes the stage while the extern keeps
+        # referencing it. With for_scatter set the negative-index fixup still
+        # has to run, so that case falls through to the extern.
+        return keys, values
+    if assume_sorted:
+        if not for_scatter:
+            # Sorted input makes the sort the identity; hand the inputs back
+            # untouched, for the same extern-consumer reason as above.
+            return keys, values
+        # The negative-index fixup still has to run, and a compute-op
+        # lowering cannot feed extern consumers, so degrade to the verified
+        # sorted hint: the extern applies the fixup, probes is_sorted once
+        # and skips the sort.
+        hint = "sorted"
+    assert hint in ["random", "nearly", "sorted"], "Unsupported hint: %s" % hint
+    check_sorted = hint != "random"
+    orig_key_dtype = keys.dtype
+    if key_dtype is not None and key_dtype != keys.dtype:
+        if key_dtype != "int32":
+            raise ValueError('only "int32" key narrowing is implemented, got %s' % key_dtype)
+        keys = cast(keys, key_dtype)
+    # 16-byte alignment with a 4-element offset factor lets the backends use
+    # 128-bit vectorized accesses on the key/value streams.
+    keys_buf, values_buf, out_keys_buf, out_values_buf = _make_sort_bufs(
+        keys.shape, keys.dtype, values.dtype
+    )
+    out_bufs = [out_keys_buf, out_values_buf]
+    # Tiny static sorts are dominated by launch and temp-allocation overhead;
+    # route them to a single-CTA cub block sort that keeps the pairs on chip.
+    if isinstance(length, (int, tvm.tir.IntImm)) and int(length) <= 4096 and is_cub_available():
+        func_name = "tvm.contrib.cub.block_sort_by_key"
+        make_call = lambda ins, outs: tvm.tir.call_packed(
+            func_name, ins[0], ins[1], outs[0], outs[1], for_scatter
+        )
+    else:
+        if in_place:
+            func_name = "tvm.contrib.thrust.stable_sort_by_key_inplace"
+        elif keys.dtype in _SORT_DTYPE_SUFFIX and values.dtype in _SORT_DTYPE_SUFFIX:
+            # Monomorphized entries skip the runtime dtype dispatch.
+            func_name = "tvm.contrib.thrust.stable_sort_by_key_%s_%s" % (
+                _SORT_DTYPE_SUFFIX[keys.dtype],
+                _SORT_DTYPE_SUFFIX[values.dtype],
+            )
+        else:
+            func_name = "tvm.contrib.thrust.stable_sort_by_key"
+        make_call = lambda ins, outs: tvm.tir.call_packed(
+            func_name, ins[0], ins[1], outs[0], outs[1], for_scatter, check_sorted
+        )
+    # The lowered packed call resolves the registry entry once per module and
+    # caches the handle, so repeated launches do not pay a registry lookup.
+    out = te.extern(
+        [keys.shape, values.shape],
+        [keys, values],
+        make_call,
+        in_buffers=[keys_buf, values_buf],
+        out_buffers=out_bufs,
+        dtype=[keys.dtype, values.dtype],
+        name="stable_sort_by_key",
+        tag="stable_sort_by_key",
+    )
+    keys_sorted, values_sorted = out[0], out[1]
+    if keys_sorted.dtype != orig_key_dtype:
+        keys_sorted = cast(keys_sorted, orig_key_dtype)
+    return keys_sorted, values_sorted
+
+
+def stable_segmented_sort_by_key_thrust(keys, values, segment_ids):
+    """Sort values with respect to keys within each segment using thrust.
+
+    All segments are sorted with one pair of device-wide sorts instead of
+    one sort launch per segment, so the cost is independent of the number
+    of segments. Sorting is stable within each segment.
+
+    Parameters
+    ----------
+    keys: tvm.te.Tensor
+        The 1D input keys.
+
+    values : tvm.te.Tensor,
+        The 1D input values.
+
+    segment_ids : tvm.te.Tensor
+        The 1D int32 segment id of every element. Ids must be
+        non-decreasing along the array, e.g. ``arange(n) // segment_len``
+        for a flattened batch of equal-length rows.
+
+    Returns
+    -------
+    keys_sorted : tvm.te.Tensor
+        The keys sorted within each segment
+
+    values_sorted : tvm.te.Tensor
+        The values sorted with respect to the keys
+    """
+    keys_buf = tvm.tir.decl_buffer(keys.shape, keys.dtype, "keys_buf", data_alignment=8)
+    values_buf = tvm.tir.decl_buffer(values.shape, values.dtype, "values_buf", data_alignment=8)
+    segment_ids_buf = tvm.tir.decl_buffer(
+        segment_ids.shape, segment_ids.dtype, "segment_ids_buf", data_alignment=8
+    )
+    out_bufs = [
+        tvm.tir.decl_buffer(keys.shape, keys.dtype, "keys_buf", data_alignment=8),
+        tvm.tir.decl_buffer(keys.shape, values.dtype, "values_buf", data_alignment=8),
+    ]
+    out = te.extern(
+        [keys.shape, values.shape],
+        [keys, values, segment_ids],
+        lambda ins, outs: tvm.tir.call_packed(
+            "tvm.contrib.thrust.stable_segmented_sort_by_key",
+            ins[0],
+            ins[1],
+            ins[2],
+            outs[0],
+            outs[1],
+        ),
+        in_buffers=[keys_buf, values_buf, segment_ids_buf],
+        out_buffers=out_bufs,
+        dtype=[keys.dtype, values.dtype],
+        name="stable_segmented_sort_by_key",
+        tag="stable_segmented_sort_by_key",
+    )
+    return out[0], out[1]
+
+
+def stable_sort_by_key_cub(keys, values, begin_bit=0, end_bit=0):
+    """Sort values with respect to keys using cub's radix sort directly.
+
+    Unlike :any:`stable_sort_by_key_thrust` the keys are consumed in place
+    by the out-of-place radix sort, saving the input copy, and the sorted
+    bit range can be restricted. Radix passes scale with
+    ``end_bit - begin_bit``, so keys whose effective entropy is far below
+    their width (e.g. packed class/score keys) sort in proportionally
+    fewer passes.
+
+    Parameters
+    ----------
+    keys: tvm.te.Tensor
+        The 1D input keys.
+
+    values : tvm.te.Tensor,
+        The 1D input values.
+
+    begin_bit : int, optional
+        The least significant key bit to sort on.
+
+    end_bit : int, optional
+        One past the most significant key bit to sort on; 0 means the full
+        key width. Bits outside [begin_bit, end_bit) are ignored by the
+        sort, so they must be constant across the keys for the result to
+        be totally ordered.
+
     Returns
     -------
     keys_sorted : tvm.te.Tensor
@@ -900,19 +1535,273 @@ def stable_sort_by_key_thrust(keys, values, for_scatter=False):
         [keys.shape, values.shape],
         [keys, values],
         lambda ins, outs: tvm.tir.call_packed(
-            "tvm.contrib.thrust.stable_sort_by_key", ins[0], ins[1], outs[0], outs[1], for_scatter
+            "tvm.contrib.cub.stable_sort_by_key",
+            ins[0],
+            ins[1],
+            outs[0],
+            outs[1],
+            begin_bit,
+            end_bit,
         ),
         in_buffers=[keys_buf, values_buf],
         out_buffers=out_bufs,
         dtype=[keys.dtype, values.dtype],
-        name="stable_sort_by_key",
-        tag="stable_sort_by_key",
+        name="stable_sort_by_key_cub",
+        tag="stable_sort_by_key_cub",
+    )
+    return out[0], out[1]
+
+
+def stable_argsort_thrust(keys):
+    """Return the sorted keys together with the sorting permutation.
+
+    The sort payload is a 4-byte arange instead of the caller's value
+    tensor, so wide (int64, float32x4, ...) values are not dragged through
+    the sort's scatter phase. Callers that need the reordered values
+    gather them afterwards with :any:`take` using the returned
+    permutation.
+
+    Parameters
+    ----------
+    keys : tvm.te.Tensor
+        The 1D input keys.
+
+    Returns
+    -------
+    keys_sorted : tvm.te.Tensor
+        The sorted keys
+
+    perm : tvm.te.Tensor
+        The int32 permutation that stably sorts the keys
+    """
+    perm = te.compute(keys.shape, lambda i: i.astype("int32"), name="arange", tag=tag.INJECTIVE)
+    return stable_sort_by_key_thrust(keys, perm)
+
+
+def sort_then_scatter_thrust(data, indices, updates):
+    """Scatter updates into data with one fused sort-and-scatter extern.
+
+    Equivalent to a 1D scatter: ``out = data; out[indices] = updates``
+    with negative indices counted from the end and later updates winning
+    on duplicate indices. The sort of the (index, update) pairs and the
+    scatter write-out run inside a single packed call, so the sorted
+    intermediates stay on device instead of round-tripping through the
+    buffers of two separate externs.
+
+    Parameters
+    ----------
+    data : tvm.te.Tensor
+        The 1D base values.
+
+    indices : tvm.te.Tensor
+        The 1D int32 or int64 scatter destinations.
+
+    updates : tvm.te.Tensor
+        The 1D values to write, same dtype as data.
+
+    Returns
+    -------
+    out : tvm.te.Tensor
+        The scattered result, same shape and dtype as data
+    """
+    data_buf = tvm.tir.decl_buffer(data.shape, data.dtype, "data_buf", data_alignment=8)
+    indices_buf = tvm.tir.decl_buffer(indices.shape, indices.dtype, "indices_buf", data_alignment=8)
+    updates_buf = tvm.tir.decl_buffer(updates.shape, updates.dtype, "updates_buf", data_alignment=8)
+    out_buf = tvm.tir.decl_buffer(data.shape, data.dtype, "out_buf", data_alignment=8)
+    out = te.extern(
+        [data.shape],
+        [data, indices, updates],
+        lambda ins, outs: tvm.tir.call_packed(
+            "tvm.contrib.thrust.sort_then_scatter", ins[0], ins[1], ins[2], outs[0]
+        ),
+        in_buffers=[data_buf, indices_buf, updates_buf],
+        out_buffers=[out_buf],
+        dtype=[data.dtype],
+        name="sort_then_scatter",
+        tag="sort_then_scatter",
+    )
+    return out
+
+
+def stable_sort_rows_by_key_thrust(keys, values, is_ascend=1):
+    """Sort every row of 2D keys/values with one device-wide sort.
+
+    Each key is packed with its row id into a single int64
+    ``(row_id << 32) | monotonic_key_bits`` and the flattened batch is
+    sorted once, so one launch replaces one sort launch per row. The
+    monotonic encoding maps float32/int32 ordering onto unsigned bit
+    ordering, and its low 32 bits are decoded back after the sort.
+
+    Parameters
+    ----------
+    keys: tvm.te.Tensor
+        The 2D input keys, float32 or int32.
+
+    values : tvm.te.Tensor,
+        The 2D input values, same shape as keys.
+
+    is_ascend : int, optional
+        Whether to sort each row ascending or descending.
+
+    Returns
+    -------
+    keys_sorted : tvm.te.Tensor
+        The keys sorted within each row
+
+    values_sorted : tvm.te.Tensor
+        The values sorted with respect to the keys
+    """
+    assert len(keys.shape) == 2, "keys must be 2D"
+    assert keys.dtype in ["float32", "int32"], "Unsupported key dtype: %s" % keys.dtype
+    rows, cols = keys.shape
+    flat_len = rows * cols
+
+    def encode(x):
+        u = tvm.tir.call_intrin("uint32", "tir.reinterpret", x)
+        if keys.dtype == "float32":
+            # Map float ordering onto unsigned ordering: flip all bits of
+            # negatives, only the sign bit of non-negatives.
+            mask = tvm.tir.Select(
+                (u >> tvm.tir.const(31, "uint32")) == tvm.tir.const(0, "uint32"),
+                tvm.tir.const(0x80000000, "uint32"),
+                tvm.tir.const(0xFFFFFFFF, "uint32"),
+            )
+        else:
+            mask = tvm.tir.const(0x80000000, "uint32")
+        u = u ^ mask
+        if not is_ascend:
+            u = u ^ tvm.tir.const(0xFFFFFFFF, "uint32")
+        return u
+
+    def decode(e):
+        if not is_ascend:
+            e = e ^ tvm.tir.const(0xFFFFFFFF, "uint32")
+        if keys.dtype == "float32":
+            u = tvm.tir.Select(
+                (e >> tvm.tir.const(31, "uint32")) == tvm.tir.const(1, "uint32"),
+                e ^ tvm.tir.const(0x80000000, "uint32"),
+                e ^ tvm.tir.const(0xFFFFFFFF, "uint32"),
+            )
+        else:
+            u = e ^ tvm.tir.const(0x80000000, "uint32")
+        return tvm.tir.call_intrin(keys.dtype, "tir.reinterpret", u)
+
+    packed = te.compute(
+        (flat_len,),
+        lambda i: (
+            (tvm.tir.indexdiv(i, cols).astype("int64") << tvm.tir.const(32, "int64"))
+            | encode(keys[tvm.tir.indexdiv(i, cols), tvm.tir.indexmod(i, cols)]).astype("int64")
+        ),
+        name="packed_keys",
+        tag=tag.INJECTIVE,
+    )
+    values_flat = reshape(values, (flat_len,))
+    packed_sorted, values_sorted_flat = stable_sort_by_key_thrust(packed, values_flat)
+    keys_sorted = te.compute(
+        (rows, cols),
+        lambda r, c: decode(
+            (packed_sorted[r * cols + c] & tvm.tir.const(0xFFFFFFFF, "int64")).astype("uint32")
+        ),
+        name="unpacked_keys",
+        tag=tag.INJECTIVE,
+    )
+    values_sorted = reshape(values_sorted_flat, (rows, cols))
+    return keys_sorted, values_sorted
+
+
+def topk_by_key_thrust(keys, values, k, is_ascend=0):
+    """Return the k best (key, value) pairs using thrust.
+
+    Unlike sorting and slicing afterwards, the outputs are k-sized, so
+    the extern writes k elements instead of n and no slice op trails the
+    sort in the graph.
+
+    Parameters
+    ----------
+    keys: tvm.te.Tensor
+        The 1D input keys.
+
+    values : tvm.te.Tensor,
+        The 1D input values.
+
+    k : int
+        The number of pairs to keep.
+
+    is_ascend : int, optional
+        Whether to keep the smallest (1) or largest (0) keys.
+
+    Returns
+    -------
+    keys_topk : tvm.te.Tensor
+        The k best keys, sorted
+
+    values_topk : tvm.te.Tensor
+        The values carried along with the k best keys
+    """
+    keys_buf = tvm.tir.decl_buffer(keys.shape, keys.dtype, "keys_buf", data_alignment=8)
+    values_buf = tvm.tir.decl_buffer(values.shape, values.dtype, "values_buf", data_alignment=8)
+    out_bufs = [
+        tvm.tir.decl_buffer((k,), keys.dtype, "keys_buf", data_alignment=8),
+        tvm.tir.decl_buffer((k,), values.dtype, "values_buf", data_alignment=8),
+    ]
+    out = te.extern(
+        [(k,), (k,)],
+        [keys, values],
+        lambda ins, outs: tvm.tir.call_packed(
+            "tvm.contrib.thrust.topk_by_key", ins[0], ins[1], outs[0], outs[1], k, is_ascend
+        ),
+        in_buffers=[keys_buf, values_buf],
+        out_buffers=out_bufs,
+        dtype=[keys.dtype, values.dtype],
+        name="topk_by_key",
+        tag="topk_by_key",
     )
     return out[0], out[1]
 
 
+def sort_indices_then_gather(keys, fields):
+    """Sort only an index payload by keys, then gather each field.
+
+    Sorting composite per-element records (e.g. NMS boxes with several
+    coordinate tensors) alongside the keys drags every field through the
+    sort's data movement. Here the sort payload is a 4-byte permutation
+    regardless of how many fields there are or how wide they are; each
+    field is reordered afterwards with a single gather.
+
+    Parameters
+    ----------
+    keys : tvm.te.Tensor
+        The 1D input keys.
+
+    fields : list of tvm.te.Tensor
+        Per-element value tensors whose first axis matches keys.
+
+    Returns
+    -------
+    keys_sorted : tvm.te.Tensor
+        The sorted keys
+
+    fields_sorted : list of tvm.te.Tensor
+        Every field gathered into key-sorted order
+    """
+    keys_sorted, perm = stable_argsort_thrust(keys)
+    return keys_sorted, [take(field, perm, axis=0) for field in fields]
+
+
+# The availability checks run in the strategy-selection path of every sort,
+# argsort, topk and scatter op, so the registry lookup is memoized; contrib
+# registration happens when libtvm loads and cannot change afterwards.
+@functools.lru_cache(maxsize=None)
 def is_thrust_available():
     """
     Test if thrust based sorting ops are available.
     """
     return get_global_func("tvm.contrib.thrust.sort", allow_missing=True) is not None
+
+
+@functools.lru_cache(maxsize=None)
+def is_cub_available():
+    """
+    Test if cub based sorting ops are available.
+    """
+    return get_global_func("tvm.contrib.cub.stable_sort_by_key", allow_missing=True) is not None
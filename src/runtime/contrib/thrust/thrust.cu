@@ -21,51 +21,236 @@
  * \file Use external Thrust library call
  */
 
+#include <cuda_runtime.h>
+// CUB only ships with the CUDA toolkit from CUDA 11 and is not vendored, so
+// the cub-backed entry points are compiled out on older toolkits.  The Python
+// side probes the registry (is_cub_available), so it routes around them.
+#if CUDART_VERSION >= 11000
+#define TVM_CUB_AVAILABLE 1
+#include <cub/cub.cuh>
+#endif
 #include <thrust/device_ptr.h>
+#include <thrust/device_vector.h>
+#include <thrust/execution_policy.h>
+#include <thrust/functional.h>
+#include <thrust/gather.h>
+#include <thrust/iterator/counting_iterator.h>
+#include <thrust/iterator/iterator_traits.h>
+#include <thrust/iterator/permutation_iterator.h>
+#include <thrust/iterator/transform_iterator.h>
+#include <thrust/iterator/zip_iterator.h>
+#include <thrust/scatter.h>
+#include <thrust/sequence.h>
 #include <thrust/sort.h>
+#include <thrust/transform.h>
 
+#include <tvm/runtime/device_api.h>
 #include <tvm/runtime/registry.h>
 #include <dlpack/dlpack.h>
 #include <algorithm>
+#include <limits>
 #include <vector>
 #include <functional>
 
+#include "../../cuda/cuda_common.h"
+
 namespace tvm {
 namespace contrib {
 
 using namespace runtime;
 
-// Performs sorting along axis -1 and returns both sorted values and indices.
+// Routes thrust's internal temporary allocations to TVM's workspace pool,
+// which caches device memory across calls.  Without it every sort pays for a
+// synchronous cudaMalloc/cudaFree pair, which dominates short sorts.
+class WorkspaceAllocator {
+ public:
+  typedef char value_type;
+
+  explicit WorkspaceAllocator(TVMContext ctx) : ctx_(ctx) {}
+
+  char* allocate(std::ptrdiff_t nbytes) {
+    return static_cast<char*>(DeviceAPI::Get(ctx_)->AllocWorkspace(ctx_, nbytes));
+  }
+
+  void deallocate(char* ptr, size_t) {
+    DeviceAPI::Get(ctx_)->FreeWorkspace(ctx_, ptr);
+  }
+
+ private:
+  TVMContext ctx_;
+};
+
+// Sorts all segments of a uniformly segmented array with a single pair of
+// device-wide radix sorts instead of one sort launch per segment.  First the
+// flattened array is sorted by value carrying its linear position, then a
+// stable sort on the segment id regroups the segments while preserving the
+// per-segment sorted order (segmented radix sort via back-to-back sorts).
+template<typename ValuesIterator, typename IndicesIterator>
+void thrust_segmented_sort(ValuesIterator values_ptr,
+                           IndicesIterator indices_ptr,
+                           bool is_ascend,
+                           int n_values,
+                           int n_iter) {
+  using DataType = typename thrust::iterator_value<ValuesIterator>::type;
+  const int n = n_values * n_iter;
+  thrust::device_vector<int> linear(n);
+  thrust::sequence(linear.begin(), linear.end());
+
+  if (is_ascend) {
+    thrust::stable_sort_by_key(values_ptr, values_ptr + n, linear.begin());
+  } else {
+    thrust::stable_sort_by_key(values_ptr, values_ptr + n, linear.begin(),
+                               thrust::greater<DataType>());
+  }
+
+  using namespace thrust::placeholders;
+  thrust::device_vector<int> segments(n);
+  thrust::transform(linear.begin(), linear.end(), segments.begin(), _1 / n_values);
+  thrust::stable_sort_by_key(
+      segments.begin(), segments.end(),
+      thrust::make_zip_iterator(thrust::make_tuple(values_ptr, linear.begin())));
+  // The linear position modulo the segment length is the index within the segment.
+  thrust::transform(linear.begin(), linear.end(), indices_ptr, _1 % n_values);
+}
+
+// Sorts contiguous segments of length n_values starting at values_ptr,
+// either all at once when the segment lengths are uniform or one segment
+// at a time when they are given by get_sort_len.
+template<typename ValuesIterator, typename IndicesIterator>
+void thrust_sort_segments(ValuesIterator values_ptr,
+                          IndicesIterator indices_ptr,
+                          bool is_ascend,
+                          int n_values,
+                          int n_iter,
+                          const std::function<int(int)> &get_sort_len,
+                          bool uniform_segments) {
+  using DataType = typename thrust::iterator_value<ValuesIterator>::type;
+  if (uniform_segments && n_iter > 1) {
+    thrust_segmented_sort(values_ptr, indices_ptr, is_ascend, n_values, n_iter);
+    return;
+  }
+
+  for (int i = 0 ; i < n_iter; ++i) {
+    int sort_len = get_sort_len(i);
+    thrust::sequence(indices_ptr, indices_ptr + sort_len);
+    if (is_ascend) {
+      thrust::sort_by_key(values_ptr, values_ptr + sort_len, indices_ptr);
+    } else {
+      thrust::sort_by_key(values_ptr, values_ptr + sort_len, indices_ptr,
+                          thrust::greater<DataType>());
+    }
+    values_ptr += n_values;
+    indices_ptr += n_values;
+  }
+}
+
+// Maps position t of the (outer, inner, axis) enumeration of a tensor to the
+// linear offset of the same element in the original (outer, axis, inner)
+// layout, i.e. the gather map that makes the sort axis innermost.
+struct StridedAxisIndex {
+  int len;    // length of the sort axis
+  int after;  // product of the dimensions after the sort axis
+  __host__ __device__ int operator()(int t) const {
+    int b = t / (len * after);
+    int r = t % (len * after);
+    int a = r / len;
+    int k = r % len;
+    return (b * len + k) * after + a;
+  }
+};
+
+// Maps position t of the truncated (segment, first k) enumeration to the
+// linear offset of the same element in the full segmented array.
+struct SegmentPrefix {
+  int len;  // full segment length
+  int k;    // kept prefix length
+  __host__ __device__ int operator()(int t) const {
+    return (t / k) * len + (t % k);
+  }
+};
+
+// Performs sorting along the given axis and returns both sorted values and
+// indices. When the axis is not innermost the data is gathered into
+// axis-innermost order on the fly, sorted, and scattered back, so the
+// caller never has to materialize a transpose. A positive topk truncates
+// the outputs to the first topk elements of every segment; the output
+// tensors must be sized accordingly.
 template<typename DataType, typename IndicesType>
 void thrust_sort(DLTensor* input,
                  DLTensor* out_values,
                  DLTensor* out_indices,
                  bool is_ascend,
-                 const std::function<int(int)> &get_sort_len) {
+                 const std::function<int(int)> &get_sort_len,
+                 bool uniform_segments,
+                 int axis,
+                 int topk) {
   thrust::device_ptr<DataType> data_ptr(static_cast<DataType *>(input->data));
   thrust::device_ptr<DataType> values_ptr(static_cast<DataType *>(out_values->data));
   thrust::device_ptr<IndicesType> indices_ptr(static_cast<IndicesType *>(out_indices->data));
 
-  int n_values = input->shape[input->ndim - 1];
+  int ndim = input->ndim;
+  if (axis < 0) axis += ndim;
+
+  int n_values = input->shape[axis];
+  int after = 1;
+  for (int i = axis + 1; i < ndim; ++i) {
+    after *= input->shape[i];
+  }
   int n_iter = 1;
-  for (int i = 0; i < input->ndim - 1; ++i) {
-    n_iter *= input->shape[i];
+  for (int i = 0; i < ndim; ++i) {
+    if (i != axis) n_iter *= input->shape[i];
   }
+  const int n = n_iter * n_values;
+  const bool truncate = topk > 0 && topk < n_values;
+  ICHECK(!truncate || uniform_segments)
+      << "top-k truncation requires uniformly segmented input";
+  const int n_out = truncate ? n_iter * topk : n;
+  auto prefix_map = thrust::make_transform_iterator(thrust::make_counting_iterator(0),
+                                                    SegmentPrefix{n_values, truncate ? topk : 1});
 
-  thrust::copy(data_ptr, data_ptr + n_iter * n_values, values_ptr);
-
-  for (int i = 0 ; i < n_iter; ++i) {
-    n_values = get_sort_len(i);
-    thrust::sequence(indices_ptr, indices_ptr + n_values);
-    if (is_ascend) {
-      thrust::sort_by_key(values_ptr, values_ptr + n_values, indices_ptr);
-    } else {
-      thrust::sort_by_key(values_ptr, values_ptr + n_values, indices_ptr,
-                          thrust::greater<DataType>());
+  if (axis == ndim - 1 || after == 1) {
+    if (!truncate) {
+      // the sort axis is already (effectively) innermost
+      thrust::copy(data_ptr, data_ptr + n, values_ptr);
+      thrust_sort_segments(values_ptr, indices_ptr, is_ascend, n_values, n_iter,
+                           get_sort_len, uniform_segments);
+      return;
     }
-    values_ptr += n_values;
-    indices_ptr += n_values;
+    // Sort in scratch buffers and hand back only the leading topk
+    // elements of every segment.
+    thrust::device_vector<DataType> values_tmp(n);
+    thrust::device_vector<IndicesType> indices_tmp(n);
+    thrust::copy(data_ptr, data_ptr + n, values_tmp.begin());
+    thrust_sort_segments(values_tmp.begin(), indices_tmp.begin(), is_ascend, n_values, n_iter,
+                         get_sort_len, uniform_segments);
+    thrust::gather(prefix_map, prefix_map + n_out, values_tmp.begin(), values_ptr);
+    thrust::gather(prefix_map, prefix_map + n_out, indices_tmp.begin(), indices_ptr);
+    return;
   }
+
+  // Gather into axis-innermost order, sort, and scatter back through the
+  // same map. The gather and scatter replace the copies into and out of the
+  // sort that the innermost-axis path performs anyway.
+  auto gather_map = thrust::make_transform_iterator(thrust::make_counting_iterator(0),
+                                                    StridedAxisIndex{n_values, after});
+  thrust::device_vector<DataType> values_tmp(n);
+  thrust::device_vector<IndicesType> indices_tmp(n);
+  thrust::gather(gather_map, gather_map + n, data_ptr, values_tmp.begin());
+  thrust_sort_segments(values_tmp.begin(), indices_tmp.begin(), is_ascend, n_values, n_iter,
+                       get_sort_len, uniform_segments);
+  if (!truncate) {
+    thrust::scatter(values_tmp.begin(), values_tmp.end(), gather_map, values_ptr);
+    thrust::scatter(indices_tmp.begin(), indices_tmp.end(), gather_map, indices_ptr);
+    return;
+  }
+  // Keep only the leading topk elements of every segment, written to the
+  // output in its own (shorter-axis) strided layout.
+  auto out_map = thrust::make_transform_iterator(thrust::make_counting_iterator(0),
+                                                 StridedAxisIndex{topk, after});
+  thrust::gather(prefix_map, prefix_map + n_out, values_tmp.begin(),
+                 thrust::make_permutation_iterator(values_ptr, out_map));
+  thrust::gather(prefix_map, prefix_map + n_out, indices_tmp.begin(),
+                 thrust::make_permutation_iterator(indices_ptr, out_map));
 }
 
 void thrust_sort_common(DLTensor* input,
@@ -74,52 +259,71 @@ void thrust_sort_common(DLTensor* input,
                         bool is_ascend,
                         const std::function<int(int)> &get_sort_len,
                         std::string data_dtype,
-                        std::string out_dtype) {
+                        std::string out_dtype,
+                        bool uniform_segments = false,
+                        int axis = -1,
+                        int topk = 0) {
   if (data_dtype == "float32") {
     if (out_dtype == "int32") {
-      thrust_sort<float, int32_t>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<float, int32_t>(input, values_out, indices_out, is_ascend,
+                                  get_sort_len, uniform_segments, axis, topk);
     } else if (out_dtype == "int64") {
-      thrust_sort<float, int64_t>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<float, int64_t>(input, values_out, indices_out, is_ascend,
+                                  get_sort_len, uniform_segments, axis, topk);
     } else if (out_dtype == "float32") {
-      thrust_sort<float, float>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<float, float>(input, values_out, indices_out, is_ascend,
+                                get_sort_len, uniform_segments, axis, topk);
     } else if (out_dtype == "float64") {
-      thrust_sort<float, double>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<float, double>(input, values_out, indices_out, is_ascend,
+                                 get_sort_len, uniform_segments, axis, topk);
     } else {
       LOG(FATAL) << "Unsupported output dtype: " << out_dtype;
     }
   } else if (data_dtype == "float64") {
     if (out_dtype == "int32") {
-      thrust_sort<double, int32_t>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<double, int32_t>(input, values_out, indices_out, is_ascend,
+                                   get_sort_len, uniform_segments, axis, topk);
     } else if (out_dtype == "int64") {
-      thrust_sort<double, int64_t>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<double, int64_t>(input, values_out, indices_out, is_ascend,
+                                   get_sort_len, uniform_segments, axis, topk);
     } else if (out_dtype == "float32") {
-      thrust_sort<double, float>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<double, float>(input, values_out, indices_out, is_ascend,
+                                 get_sort_len, uniform_segments, axis, topk);
     } else if (out_dtype == "float64") {
-      thrust_sort<double, double>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<double, double>(input, values_out, indices_out, is_ascend,
+                                  get_sort_len, uniform_segments, axis, topk);
     } else {
       LOG(FATAL) << "Unsupported output dtype: " << out_dtype;
     }
   } else if (data_dtype == "int32") {
     if (out_dtype == "int32") {
-      thrust_sort<int32_t, int32_t>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<int32_t, int32_t>(input, values_out, indices_out, is_ascend,
+                                    get_sort_len, uniform_segments, axis, topk);
     } else if (out_dtype == "int64") {
-      thrust_sort<int32_t, int64_t>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<int32_t, int64_t>(input, values_out, indices_out, is_ascend,
+                                    get_sort_len, uniform_segments, axis, topk);
     } else if (out_dtype == "float32") {
-      thrust_sort<int32_t, float>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<int32_t, float>(input, values_out, indices_out, is_ascend,
+                                  get_sort_len, uniform_segments, axis, topk);
     } else if (out_dtype == "float64") {
-      thrust_sort<int32_t, double>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<int32_t, double>(input, values_out, indices_out, is_ascend,
+                                   get_sort_len, uniform_segments, axis, topk);
     } else {
       LOG(FATAL) << "Unsupported output dtype: " << out_dtype;
     }
   }  else if (data_dtype == "int64") {
     if (out_dtype == "int32") {
-      thrust_sort<int64_t, int32_t>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<int64_t, int32_t>(input, values_out, indices_out, is_ascend,
+                                    get_sort_len, uniform_segments, axis, topk);
     } else if (out_dtype == "int64") {
-      thrust_sort<int64_t, int64_t>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<int64_t, int64_t>(input, values_out, indices_out, is_ascend,
+                                    get_sort_len, uniform_segments, axis, topk);
     } else if (out_dtype == "float32") {
-      thrust_sort<int64_t, float>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<int64_t, float>(input, values_out, indices_out, is_ascend,
+                                  get_sort_len, uniform_segments, axis, topk);
     } else if (out_dtype == "float64") {
-      thrust_sort<int64_t, double>(input, values_out, indices_out, is_ascend, get_sort_len);
+      thrust_sort<int64_t, double>(input, values_out, indices_out, is_ascend,
+                                   get_sort_len, uniform_segments, axis, topk);
     } else {
       LOG(FATAL) << "Unsupported output dtype: " << out_dtype;
     }
@@ -136,6 +340,7 @@ TVM_REGISTER_GLOBAL("tvm.contrib.thrust.sort_nms")
   DLTensor* values_out = args[2];
   DLTensor* indices_out = args[3];
   bool is_ascend = args[4];
+  int axis = args.num_args > 5 ? static_cast<int>(args[5]) : input->ndim - 1;
 
   auto data_dtype = DLDataType2String(input->dtype);
   auto out_dtype = DLDataType2String(indices_out->dtype);
@@ -143,7 +348,7 @@ TVM_REGISTER_GLOBAL("tvm.contrib.thrust.sort_nms")
   thrust::device_ptr<int> valid_count_ptr(static_cast<int *>(valid_count->data));
   auto get_sort_len = [&valid_count_ptr](int i) { return valid_count_ptr[i]; };
   thrust_sort_common(input, values_out, indices_out, is_ascend, get_sort_len,
-                     data_dtype, out_dtype);
+                     data_dtype, out_dtype, /*uniform_segments=*/false, axis);
 });
 
 
@@ -154,89 +359,721 @@ TVM_REGISTER_GLOBAL("tvm.contrib.thrust.sort")
   DLTensor* values_out = args[1];
   DLTensor* indices_out = args[2];
   bool is_ascend = args[3];
+  int axis = args.num_args > 4 ? static_cast<int>(args[4]) : input->ndim - 1;
+  int topk = args.num_args > 5 ? static_cast<int>(args[5]) : 0;
 
   auto data_dtype = DLDataType2String(input->dtype);
   auto out_dtype = DLDataType2String(indices_out->dtype);
 
-  int n_values = input->shape[input->ndim - 1];
+  int n_values = input->shape[axis < 0 ? input->ndim + axis : axis];
   auto get_sort_len = [=](int i) { return n_values; };
+  // All segments have the same length here, so they can be sorted in one
+  // segmented pass rather than one sort launch per segment.
   thrust_sort_common(input, values_out, indices_out, is_ascend, get_sort_len,
-                     data_dtype, out_dtype);
+                     data_dtype, out_dtype, /*uniform_segments=*/true, axis, topk);
 });
 
+// Interprets negative keys as indices counted from the end, used by the
+// scatter implementation.
+template<typename KeyType>
+struct NegToPos {
+  KeyType size;
+  __host__ __device__ KeyType operator()(const KeyType& k) const {
+    return k < 0 ? k + size : k;
+  }
+};
+
 template<typename KeyType, typename ValueType>
 void thrust_stable_sort_by_key(DLTensor* keys_in,
                                DLTensor* values_in,
                                DLTensor* keys_out,
                                DLTensor* values_out,
-                               bool for_scatter) {
+                               bool for_scatter,
+                               bool check_sorted) {
   const auto size = keys_in->shape[0];
   thrust::device_ptr<KeyType> keys_in_ptr(static_cast<KeyType *>(keys_in->data));
   thrust::device_ptr<ValueType> values_in_ptr(static_cast<ValueType *>(values_in->data));
   thrust::device_ptr<KeyType> keys_out_ptr(static_cast<KeyType *>(keys_out->data));
   thrust::device_ptr<ValueType> values_out_ptr(static_cast<ValueType *>(values_out->data));
 
+  WorkspaceAllocator alloc(keys_in->ctx);
+  // Run on TVM's current stream rather than the legacy default stream, so
+  // the sort can overlap with work queued on other streams.
+  auto policy = thrust::cuda::par(alloc).on(CUDAThreadEntry::ThreadLocal()->stream);
+
   if (for_scatter) {
-    thrust::transform(keys_in_ptr, keys_in_ptr + size, keys_out_ptr, [size] __device__(KeyType k) {
-      if (k < 0) return k + static_cast<KeyType>(size);
-      return k;
-    });
+    // The negative-index fixup rides along the copy into the output buffer,
+    // so the keys stream is read and written exactly once before the sort.
+    auto fixup = thrust::make_transform_iterator(
+        keys_in_ptr, NegToPos<KeyType>{static_cast<KeyType>(size)});
+    thrust::copy(policy, fixup, fixup + size, keys_out_ptr);
   } else {
-    thrust::copy(keys_in_ptr, keys_in_ptr + size, keys_out_ptr);
+    thrust::copy(policy, keys_in_ptr, keys_in_ptr + size, keys_out_ptr);
   }
-  thrust::copy(values_in_ptr, values_in_ptr + size, values_out_ptr);
+  thrust::copy(policy, values_in_ptr, values_in_ptr + size, values_out_ptr);
+  // The outputs already hold the input at this point, so a sorted input
+  // means the sort itself can be skipped for the cost of one read pass.
+  if (check_sorted && thrust::is_sorted(policy, keys_out_ptr, keys_out_ptr + size)) {
+    return;
+  }
+  thrust::stable_sort_by_key(policy, keys_out_ptr, keys_out_ptr + size, values_out_ptr);
+}
 
-  thrust::stable_sort_by_key(keys_out_ptr, keys_out_ptr + size, values_out_ptr);
+// Sorts every segment of a flat array in one pair of device-wide sorts
+// instead of one launch per segment, using the same back-to-back trick as
+// thrust_segmented_sort but with caller-provided (possibly non-uniform)
+// segment ids: first a global stable sort by key carrying values and segment
+// ids, then a stable sort on the segment ids regroups the segments while
+// preserving each segment's sorted order.
+template<typename KeyType, typename ValueType>
+void thrust_stable_segmented_sort_by_key(DLTensor* keys_in,
+                                         DLTensor* values_in,
+                                         DLTensor* segment_ids,
+                                         DLTensor* keys_out,
+                                         DLTensor* values_out) {
+  const auto size = keys_in->shape[0];
+  thrust::device_ptr<KeyType> keys_in_ptr(static_cast<KeyType *>(keys_in->data));
+  thrust::device_ptr<ValueType> values_in_ptr(static_cast<ValueType *>(values_in->data));
+  thrust::device_ptr<int> segment_ids_ptr(static_cast<int *>(segment_ids->data));
+  thrust::device_ptr<KeyType> keys_out_ptr(static_cast<KeyType *>(keys_out->data));
+  thrust::device_ptr<ValueType> values_out_ptr(static_cast<ValueType *>(values_out->data));
+
+  WorkspaceAllocator alloc(keys_in->ctx);
+  auto policy = thrust::cuda::par(alloc).on(CUDAThreadEntry::ThreadLocal()->stream);
+
+  thrust::copy(policy, keys_in_ptr, keys_in_ptr + size, keys_out_ptr);
+  thrust::copy(policy, values_in_ptr, values_in_ptr + size, values_out_ptr);
+  // The second pass sorts the segment ids, so work on a scratch copy.
+  thrust::device_vector<int> segments(segment_ids_ptr, segment_ids_ptr + size);
+  thrust::stable_sort_by_key(
+      policy, keys_out_ptr, keys_out_ptr + size,
+      thrust::make_zip_iterator(thrust::make_tuple(values_out_ptr, segments.begin())));
+  thrust::stable_sort_by_key(
+      policy, segments.begin(), segments.end(),
+      thrust::make_zip_iterator(thrust::make_tuple(keys_out_ptr, values_out_ptr)));
 }
 
-TVM_REGISTER_GLOBAL("tvm.contrib.thrust.stable_sort_by_key")
+// Variant that reuses the input storage as the radix sort's alternate buffer
+// (cub::DoubleBuffer), so the only scratch allocated on top of the nominal
+// output is cub's O(P) temp storage instead of a second pair of N-element
+// arrays.  The inputs are clobbered; callers opt in when the tensors have no
+// other consumers.
+template<typename KeyType, typename ValueType>
+void thrust_stable_sort_by_key_inplace(DLTensor* keys_in,
+                                       DLTensor* values_in,
+                                       DLTensor* keys_out,
+                                       DLTensor* values_out,
+                                       bool for_scatter,
+                                       bool check_sorted) {
+  const auto size = keys_in->shape[0];
+  KeyType* keys_in_ptr = static_cast<KeyType *>(keys_in->data);
+  ValueType* values_in_ptr = static_cast<ValueType *>(values_in->data);
+  KeyType* keys_out_ptr = static_cast<KeyType *>(keys_out->data);
+  ValueType* values_out_ptr = static_cast<ValueType *>(values_out->data);
+
+  cudaStream_t stream = CUDAThreadEntry::ThreadLocal()->stream;
+  WorkspaceAllocator alloc(keys_in->ctx);
+  auto policy = thrust::cuda::par(alloc).on(stream);
+
+  if (for_scatter) {
+    thrust::device_ptr<KeyType> keys(keys_in_ptr);
+    thrust::transform(policy, keys, keys + size, keys,
+                      NegToPos<KeyType>{static_cast<KeyType>(size)});
+  }
+
+  if (check_sorted) {
+    thrust::device_ptr<KeyType> keys(keys_in_ptr);
+    if (thrust::is_sorted(policy, keys, keys + size)) {
+      thrust::copy(policy, keys, keys + size, thrust::device_ptr<KeyType>(keys_out_ptr));
+      thrust::device_ptr<ValueType> values(values_in_ptr);
+      thrust::copy(policy, values, values + size, thrust::device_ptr<ValueType>(values_out_ptr));
+      return;
+    }
+  }
+
+#ifdef TVM_CUB_AVAILABLE
+  cub::DoubleBuffer<KeyType> db_keys(keys_in_ptr, keys_out_ptr);
+  cub::DoubleBuffer<ValueType> db_values(values_in_ptr, values_out_ptr);
+  size_t temp_bytes = 0;
+  cub::DeviceRadixSort::SortPairs(nullptr, temp_bytes, db_keys, db_values, size,
+                                  0, sizeof(KeyType) * 8, stream);
+  char* temp = alloc.allocate(temp_bytes);
+  cub::DeviceRadixSort::SortPairs(temp, temp_bytes, db_keys, db_values, size,
+                                  0, sizeof(KeyType) * 8, stream);
+  alloc.deallocate(temp, temp_bytes);
+
+  // Radix sorting may finish with the result in either buffer of the pair.
+  if (db_keys.Current() != keys_out_ptr) {
+    thrust::device_ptr<KeyType> current(db_keys.Current());
+    thrust::copy(policy, current, current + size, thrust::device_ptr<KeyType>(keys_out_ptr));
+  }
+  if (db_values.Current() != values_out_ptr) {
+    thrust::device_ptr<ValueType> current(db_values.Current());
+    thrust::copy(policy, current, current + size, thrust::device_ptr<ValueType>(values_out_ptr));
+  }
+#else
+  // Without CUB there is no DoubleBuffer radix path; fall back to the
+  // out-of-place thrust sort, which produces the same outputs at the cost
+  // of the extra scratch pair.  for_scatter and check_sorted were already
+  // handled above.
+  thrust_stable_sort_by_key<KeyType, ValueType>(keys_in, values_in, keys_out, values_out,
+                                                false, false);
+#endif
+}
+
+#ifdef TVM_CUB_AVAILABLE
+// Sorts up to BLOCK_THREADS * ITEMS_PER_THREAD pairs with a single CTA
+// holding keys and values in shared memory/registers.  For the tiny inputs
+// of per-batch NMS this replaces a device-wide radix sort whose launch and
+// temp-allocation overhead dwarfs the actual sorting work.  The tail is
+// padded with pad_key (+inf for floating keys, the key-type maximum
+// otherwise) so it sorts past the valid prefix and is never written back.
+template<typename KeyType, typename ValueType, int BLOCK_THREADS, int ITEMS_PER_THREAD>
+__global__ void block_sort_by_key_kernel(const KeyType* keys_in,
+                                         const ValueType* values_in,
+                                         KeyType* keys_out,
+                                         ValueType* values_out,
+                                         int n,
+                                         KeyType pad_key,
+                                         bool for_scatter) {
+  typedef cub::BlockRadixSort<KeyType, BLOCK_THREADS, ITEMS_PER_THREAD, ValueType> BlockRadixSort;
+  __shared__ typename BlockRadixSort::TempStorage temp_storage;
+
+  KeyType keys[ITEMS_PER_THREAD];
+  ValueType values[ITEMS_PER_THREAD];
+  for (int i = 0; i < ITEMS_PER_THREAD; ++i) {
+    int idx = threadIdx.x * ITEMS_PER_THREAD + i;
+    if (idx < n) {
+      KeyType key = keys_in[idx];
+      if (for_scatter && key < KeyType(0)) key += static_cast<KeyType>(n);
+      keys[i] = key;
+      values[i] = values_in[idx];
+    } else {
+      keys[i] = pad_key;
+    }
+  }
+  BlockRadixSort(temp_storage).Sort(keys, values);
+  for (int i = 0; i < ITEMS_PER_THREAD; ++i) {
+    int idx = threadIdx.x * ITEMS_PER_THREAD + i;
+    if (idx < n) {
+      keys_out[idx] = keys[i];
+      values_out[idx] = values[i];
+    }
+  }
+}
+
+template<typename KeyType, typename ValueType>
+void cub_block_sort_by_key(DLTensor* keys_in,
+                           DLTensor* values_in,
+                           DLTensor* keys_out,
+                           DLTensor* values_out,
+                           bool for_scatter) {
+  const int n = static_cast<int>(keys_in->shape[0]);
+  const KeyType* keys_in_ptr = static_cast<KeyType *>(keys_in->data);
+  const ValueType* values_in_ptr = static_cast<ValueType *>(values_in->data);
+  KeyType* keys_out_ptr = static_cast<KeyType *>(keys_out->data);
+  ValueType* values_out_ptr = static_cast<ValueType *>(values_out->data);
+  cudaStream_t stream = CUDAThreadEntry::ThreadLocal()->stream;
+  constexpr int kBlockThreads = 128;
+  // FLT_MAX would sort ahead of genuine +inf keys and silently drop them
+  // from the first-n output; pad with +inf for floating keys (the pads sit
+  // after the valid range, so radix-sort stability keeps real +inf elements
+  // first) and with the type maximum otherwise.
+  KeyType pad_key = std::numeric_limits<KeyType>::has_infinity
+                        ? std::numeric_limits<KeyType>::infinity()
+                        : std::numeric_limits<KeyType>::max();
+
+#define TVM_CUB_BLOCK_SORT_CASE(ITEMS_PER_THREAD)                                        \
+  if (n <= kBlockThreads * ITEMS_PER_THREAD) {                                           \
+    block_sort_by_key_kernel<KeyType, ValueType, kBlockThreads, ITEMS_PER_THREAD>        \
+        <<<1, kBlockThreads, 0, stream>>>(keys_in_ptr, values_in_ptr, keys_out_ptr,      \
+                                          values_out_ptr, n, pad_key, for_scatter);      \
+    return;                                                                              \
+  }
+
+  TVM_CUB_BLOCK_SORT_CASE(1)
+  TVM_CUB_BLOCK_SORT_CASE(2)
+  TVM_CUB_BLOCK_SORT_CASE(4)
+  TVM_CUB_BLOCK_SORT_CASE(8)
+  TVM_CUB_BLOCK_SORT_CASE(16)
+  TVM_CUB_BLOCK_SORT_CASE(32)
+#undef TVM_CUB_BLOCK_SORT_CASE
+
+  LOG(FATAL) << "block_sort_by_key supports at most " << kBlockThreads * 32
+             << " elements, got " << n;
+}
+
+TVM_REGISTER_GLOBAL("tvm.contrib.cub.block_sort_by_key")
 .set_body([](TVMArgs args, TVMRetValue* ret) {
-  ICHECK_GE(args.num_args, 5);
+  ICHECK_GE(args.num_args, 4);
   DLTensor* keys_in = args[0];
   DLTensor* values_in = args[1];
   DLTensor* keys_out = args[2];
   DLTensor* values_out = args[3];
-  bool for_scatter = args[4];
+  bool for_scatter = args.num_args > 4 ? static_cast<bool>(args[4]) : false;
 
   auto key_dtype = DLDataType2String(keys_in->dtype);
   auto value_dtype = DLDataType2String(values_in->dtype);
 
   if (key_dtype == "int32") {
     if (value_dtype == "int32") {
-      thrust_stable_sort_by_key<int, int>(keys_in, values_in, keys_out, values_out,
-                                          for_scatter);
+      cub_block_sort_by_key<int, int>(keys_in, values_in, keys_out, values_out, for_scatter);
     } else if (value_dtype == "int64") {
-      thrust_stable_sort_by_key<int, int64_t>(keys_in, values_in, keys_out, values_out,
+      cub_block_sort_by_key<int, int64_t>(keys_in, values_in, keys_out, values_out, for_scatter);
+    } else if (value_dtype == "float32") {
+      cub_block_sort_by_key<int, float>(keys_in, values_in, keys_out, values_out, for_scatter);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else if (key_dtype == "int64") {
+    if (value_dtype == "int32") {
+      cub_block_sort_by_key<int64_t, int>(keys_in, values_in, keys_out, values_out, for_scatter);
+    } else if (value_dtype == "int64") {
+      cub_block_sort_by_key<int64_t, int64_t>(keys_in, values_in, keys_out, values_out,
                                               for_scatter);
     } else if (value_dtype == "float32") {
-      thrust_stable_sort_by_key<int, float>(keys_in, values_in, keys_out, values_out,
+      cub_block_sort_by_key<int64_t, float>(keys_in, values_in, keys_out, values_out,
+                                            for_scatter);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else if (key_dtype == "float32") {
+    if (value_dtype == "int32") {
+      cub_block_sort_by_key<float, int>(keys_in, values_in, keys_out, values_out, for_scatter);
+    } else if (value_dtype == "int64") {
+      cub_block_sort_by_key<float, int64_t>(keys_in, values_in, keys_out, values_out,
                                             for_scatter);
+    } else if (value_dtype == "float32") {
+      cub_block_sort_by_key<float, float>(keys_in, values_in, keys_out, values_out, for_scatter);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else {
+    LOG(FATAL) << "Unsupported key dtype: " << key_dtype;
+  }
+});
+#endif  // TVM_CUB_AVAILABLE
+
+// True when position i closes a run of equal keys; with stably sorted keys
+// the run end carries the update that appeared last in the original order.
+template<typename IndexType>
+struct IsRunEnd {
+  const IndexType* keys;
+  int64_t n;
+  __host__ __device__ bool operator()(int64_t i) const {
+    return i + 1 == n || keys[i] != keys[i + 1];
+  }
+};
+
+// Fused scatter-via-sort: copies the base data into the output, stably sorts
+// the (index, update) pairs, and scatters the updates, all inside one packed
+// call so the sorted intermediates never round-trip through extern buffers.
+// Only the last update of every duplicate-index run is written, which both
+// matches scatter semantics (later updates win) and keeps the scatter free
+// of write races.
+template<typename IndexType, typename ValueType>
+void thrust_sort_then_scatter(DLTensor* data,
+                              DLTensor* indices_in,
+                              DLTensor* updates_in,
+                              DLTensor* out) {
+  const auto n = data->shape[0];
+  const auto ni = indices_in->shape[0];
+  thrust::device_ptr<ValueType> data_ptr(static_cast<ValueType *>(data->data));
+  thrust::device_ptr<IndexType> indices_in_ptr(static_cast<IndexType *>(indices_in->data));
+  thrust::device_ptr<ValueType> updates_in_ptr(static_cast<ValueType *>(updates_in->data));
+  thrust::device_ptr<ValueType> out_ptr(static_cast<ValueType *>(out->data));
+
+  WorkspaceAllocator alloc(data->ctx);
+  auto policy = thrust::cuda::par(alloc).on(CUDAThreadEntry::ThreadLocal()->stream);
+
+  thrust::copy(policy, data_ptr, data_ptr + n, out_ptr);
+
+  thrust::device_vector<IndexType> indices(ni);
+  thrust::device_vector<ValueType> updates(ni);
+  auto fixup = thrust::make_transform_iterator(
+      indices_in_ptr, NegToPos<IndexType>{static_cast<IndexType>(n)});
+  thrust::copy(policy, fixup, fixup + ni, indices.begin());
+  thrust::copy(policy, updates_in_ptr, updates_in_ptr + ni, updates.begin());
+
+  thrust::stable_sort_by_key(policy, indices.begin(), indices.end(), updates.begin());
+
+  auto run_end = thrust::make_transform_iterator(
+      thrust::make_counting_iterator<int64_t>(0),
+      IsRunEnd<IndexType>{thrust::raw_pointer_cast(indices.data()), ni});
+  thrust::scatter_if(policy, updates.begin(), updates.end(), indices.begin(), run_end, out_ptr);
+}
+
+TVM_REGISTER_GLOBAL("tvm.contrib.thrust.sort_then_scatter")
+.set_body([](TVMArgs args, TVMRetValue* ret) {
+  ICHECK_GE(args.num_args, 4);
+  DLTensor* data = args[0];
+  DLTensor* indices = args[1];
+  DLTensor* updates = args[2];
+  DLTensor* out = args[3];
+
+  auto index_dtype = DLDataType2String(indices->dtype);
+  auto value_dtype = DLDataType2String(updates->dtype);
+
+  if (index_dtype == "int32") {
+    if (value_dtype == "int32") {
+      thrust_sort_then_scatter<int, int>(data, indices, updates, out);
+    } else if (value_dtype == "int64") {
+      thrust_sort_then_scatter<int, int64_t>(data, indices, updates, out);
+    } else if (value_dtype == "float32") {
+      thrust_sort_then_scatter<int, float>(data, indices, updates, out);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else if (index_dtype == "int64") {
+    if (value_dtype == "int32") {
+      thrust_sort_then_scatter<int64_t, int>(data, indices, updates, out);
+    } else if (value_dtype == "int64") {
+      thrust_sort_then_scatter<int64_t, int64_t>(data, indices, updates, out);
+    } else if (value_dtype == "float32") {
+      thrust_sort_then_scatter<int64_t, float>(data, indices, updates, out);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else {
+    LOG(FATAL) << "Unsupported index dtype: " << index_dtype;
+  }
+});
+
+void stable_sort_by_key_dispatch(TVMArgs args, bool in_place) {
+  ICHECK_GE(args.num_args, 5);
+  DLTensor* keys_in = args[0];
+  DLTensor* values_in = args[1];
+  DLTensor* keys_out = args[2];
+  DLTensor* values_out = args[3];
+  bool for_scatter = args[4];
+  // Optional trailing flag: probe with thrust::is_sorted first and skip the
+  // sort when the keys are already in order.
+  bool check_sorted = args.num_args > 5 ? static_cast<bool>(args[5]) : false;
+
+  auto key_dtype = DLDataType2String(keys_in->dtype);
+  auto value_dtype = DLDataType2String(values_in->dtype);
+
+  if (key_dtype == "int32") {
+    if (value_dtype == "int32") {
+      (in_place ? thrust_stable_sort_by_key_inplace<int, int>
+                : thrust_stable_sort_by_key<int, int>)(
+          keys_in, values_in, keys_out, values_out, for_scatter, check_sorted);
+    } else if (value_dtype == "int64") {
+      (in_place ? thrust_stable_sort_by_key_inplace<int, int64_t>
+                : thrust_stable_sort_by_key<int, int64_t>)(
+          keys_in, values_in, keys_out, values_out, for_scatter, check_sorted);
+    } else if (value_dtype == "float32") {
+      (in_place ? thrust_stable_sort_by_key_inplace<int, float>
+                : thrust_stable_sort_by_key<int, float>)(
+          keys_in, values_in, keys_out, values_out, for_scatter, check_sorted);
     } else {
       LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
     }
   } else if (key_dtype == "int64") {
     if (value_dtype == "int32") {
-      thrust_stable_sort_by_key<int64_t, int>(keys_in, values_in, keys_out, values_out,
-                                              for_scatter);
+      (in_place ? thrust_stable_sort_by_key_inplace<int64_t, int>
+                : thrust_stable_sort_by_key<int64_t, int>)(
+          keys_in, values_in, keys_out, values_out, for_scatter, check_sorted);
     } else if (value_dtype == "int64") {
-      thrust_stable_sort_by_key<int64_t, int64_t>(keys_in, values_in, keys_out, values_out,
-                                                  for_scatter);
+      (in_place ? thrust_stable_sort_by_key_inplace<int64_t, int64_t>
+                : thrust_stable_sort_by_key<int64_t, int64_t>)(
+          keys_in, values_in, keys_out, values_out, for_scatter, check_sorted);
     } else if (value_dtype == "float32") {
-      thrust_stable_sort_by_key<int64_t, float>(keys_in, values_in, keys_out, values_out,
-                                                for_scatter);
+      (in_place ? thrust_stable_sort_by_key_inplace<int64_t, float>
+                : thrust_stable_sort_by_key<int64_t, float>)(
+          keys_in, values_in, keys_out, values_out, for_scatter, check_sorted);
     } else {
       LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
     }
   } else if (key_dtype == "float32") {
     if (value_dtype == "int32") {
-      thrust_stable_sort_by_key<float, int>(keys_in, values_in, keys_out, values_out,
-                                            for_scatter);
+      (in_place ? thrust_stable_sort_by_key_inplace<float, int>
+                : thrust_stable_sort_by_key<float, int>)(
+          keys_in, values_in, keys_out, values_out, for_scatter, check_sorted);
     } else if (value_dtype == "int64") {
-      thrust_stable_sort_by_key<float, int64_t>(keys_in, values_in, keys_out, values_out,
-                                              for_scatter);
+      (in_place ? thrust_stable_sort_by_key_inplace<float, int64_t>
+                : thrust_stable_sort_by_key<float, int64_t>)(
+          keys_in, values_in, keys_out, values_out, for_scatter, check_sorted);
     } else if (value_dtype == "float32") {
-      thrust_stable_sort_by_key<float, float>(keys_in, values_in, keys_out, values_out,
-                                              for_scatter);
+      (in_place ? thrust_stable_sort_by_key_inplace<float, float>
+                : thrust_stable_sort_by_key<float, float>)(
+          keys_in, values_in, keys_out, values_out, for_scatter, check_sorted);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else {
+    LOG(FATAL) << "Unsupported key dtype: " << key_dtype;
+  }
+}
+
+TVM_REGISTER_GLOBAL("tvm.contrib.thrust.stable_sort_by_key")
+.set_body([](TVMArgs args, TVMRetValue* ret) {
+  stable_sort_by_key_dispatch(args, /*in_place=*/false);
+});
+
+TVM_REGISTER_GLOBAL("tvm.contrib.thrust.stable_sort_by_key_inplace")
+.set_body([](TVMArgs args, TVMRetValue* ret) {
+  stable_sort_by_key_dispatch(args, /*in_place=*/true);
+});
+
+#ifdef TVM_CUB_AVAILABLE
+// Direct cub::DeviceRadixSort backend.  Unlike the thrust path this needs no
+// input copy (the out-of-place SortPairs overload reads the inputs as-is)
+// and lets the caller restrict the sorted bit range: radix passes scale with
+// end_bit - begin_bit, so keys whose entropy is far below their width (e.g.
+// class/score packings) sort in proportionally fewer passes.
+template<typename KeyType, typename ValueType>
+void cub_stable_sort_by_key(DLTensor* keys_in,
+                            DLTensor* values_in,
+                            DLTensor* keys_out,
+                            DLTensor* values_out,
+                            int begin_bit,
+                            int end_bit) {
+  const auto size = keys_in->shape[0];
+  if (end_bit <= 0) end_bit = sizeof(KeyType) * 8;
+  KeyType* keys_in_ptr = static_cast<KeyType *>(keys_in->data);
+  ValueType* values_in_ptr = static_cast<ValueType *>(values_in->data);
+  KeyType* keys_out_ptr = static_cast<KeyType *>(keys_out->data);
+  ValueType* values_out_ptr = static_cast<ValueType *>(values_out->data);
+
+  cudaStream_t stream = CUDAThreadEntry::ThreadLocal()->stream;
+  size_t temp_bytes = 0;
+  cub::DeviceRadixSort::SortPairs(nullptr, temp_bytes, keys_in_ptr, keys_out_ptr,
+                                  values_in_ptr, values_out_ptr, size, begin_bit, end_bit,
+                                  stream);
+  WorkspaceAllocator alloc(keys_in->ctx);
+  char* temp = alloc.allocate(temp_bytes);
+  cub::DeviceRadixSort::SortPairs(temp, temp_bytes, keys_in_ptr, keys_out_ptr,
+                                  values_in_ptr, values_out_ptr, size, begin_bit, end_bit,
+                                  stream);
+  alloc.deallocate(temp, temp_bytes);
+}
+
+TVM_REGISTER_GLOBAL("tvm.contrib.cub.stable_sort_by_key")
+.set_body([](TVMArgs args, TVMRetValue* ret) {
+  ICHECK_GE(args.num_args, 4);
+  DLTensor* keys_in = args[0];
+  DLTensor* values_in = args[1];
+  DLTensor* keys_out = args[2];
+  DLTensor* values_out = args[3];
+  int begin_bit = args.num_args > 4 ? static_cast<int>(args[4]) : 0;
+  int end_bit = args.num_args > 5 ? static_cast<int>(args[5]) : 0;
+
+  auto key_dtype = DLDataType2String(keys_in->dtype);
+  auto value_dtype = DLDataType2String(values_in->dtype);
+
+  if (key_dtype == "int32") {
+    if (value_dtype == "int32") {
+      cub_stable_sort_by_key<int, int>(keys_in, values_in, keys_out, values_out,
+                                       begin_bit, end_bit);
+    } else if (value_dtype == "int64") {
+      cub_stable_sort_by_key<int, int64_t>(keys_in, values_in, keys_out, values_out,
+                                           begin_bit, end_bit);
+    } else if (value_dtype == "float32") {
+      cub_stable_sort_by_key<int, float>(keys_in, values_in, keys_out, values_out,
+                                         begin_bit, end_bit);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else if (key_dtype == "int64") {
+    if (value_dtype == "int32") {
+      cub_stable_sort_by_key<int64_t, int>(keys_in, values_in, keys_out, values_out,
+                                           begin_bit, end_bit);
+    } else if (value_dtype == "int64") {
+      cub_stable_sort_by_key<int64_t, int64_t>(keys_in, values_in, keys_out, values_out,
+                                               begin_bit, end_bit);
+    } else if (value_dtype == "float32") {
+      cub_stable_sort_by_key<int64_t, float>(keys_in, values_in, keys_out, values_out,
+                                             begin_bit, end_bit);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else if (key_dtype == "float32") {
+    if (value_dtype == "int32") {
+      cub_stable_sort_by_key<float, int>(keys_in, values_in, keys_out, values_out,
+                                         begin_bit, end_bit);
+    } else if (value_dtype == "int64") {
+      cub_stable_sort_by_key<float, int64_t>(keys_in, values_in, keys_out, values_out,
+                                             begin_bit, end_bit);
+    } else if (value_dtype == "float32") {
+      cub_stable_sort_by_key<float, float>(keys_in, values_in, keys_out, values_out,
+                                           begin_bit, end_bit);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else {
+    LOG(FATAL) << "Unsupported key dtype: " << key_dtype;
+  }
+});
+#endif  // TVM_CUB_AVAILABLE
+
+// Top-k by key: sorts scratch copies of the pairs and writes only the first
+// k to the k-sized outputs, so the extern's output traffic and footprint
+// scale with k instead of n.  The selection itself still runs as a full
+// device sort: cub/thrust expose no threshold-selection primitive that
+// would give the O(n + k log k) pipeline, and the sort is already the
+// fastest device-wide ordering available here.
+template<typename KeyType, typename ValueType>
+void thrust_topk_by_key(DLTensor* keys_in,
+                        DLTensor* values_in,
+                        DLTensor* keys_out,
+                        DLTensor* values_out,
+                        int k,
+                        bool is_ascend) {
+  const auto n = keys_in->shape[0];
+  ICHECK_LE(k, n) << "k must not exceed the number of elements";
+  thrust::device_ptr<KeyType> keys_in_ptr(static_cast<KeyType *>(keys_in->data));
+  thrust::device_ptr<ValueType> values_in_ptr(static_cast<ValueType *>(values_in->data));
+  thrust::device_ptr<KeyType> keys_out_ptr(static_cast<KeyType *>(keys_out->data));
+  thrust::device_ptr<ValueType> values_out_ptr(static_cast<ValueType *>(values_out->data));
+
+  WorkspaceAllocator alloc(keys_in->ctx);
+  auto policy = thrust::cuda::par(alloc).on(CUDAThreadEntry::ThreadLocal()->stream);
+
+  KeyType* keys_scratch = reinterpret_cast<KeyType*>(alloc.allocate(n * sizeof(KeyType)));
+  ValueType* values_scratch = reinterpret_cast<ValueType*>(alloc.allocate(n * sizeof(ValueType)));
+  thrust::device_ptr<KeyType> keys_tmp(keys_scratch);
+  thrust::device_ptr<ValueType> values_tmp(values_scratch);
+  thrust::copy(policy, keys_in_ptr, keys_in_ptr + n, keys_tmp);
+  thrust::copy(policy, values_in_ptr, values_in_ptr + n, values_tmp);
+
+  if (is_ascend) {
+    thrust::stable_sort_by_key(policy, keys_tmp, keys_tmp + n, values_tmp);
+  } else {
+    thrust::stable_sort_by_key(policy, keys_tmp, keys_tmp + n, values_tmp,
+                               thrust::greater<KeyType>());
+  }
+
+  thrust::copy(policy, keys_tmp, keys_tmp + k, keys_out_ptr);
+  thrust::copy(policy, values_tmp, values_tmp + k, values_out_ptr);
+  alloc.deallocate(reinterpret_cast<char*>(values_scratch), n * sizeof(ValueType));
+  alloc.deallocate(reinterpret_cast<char*>(keys_scratch), n * sizeof(KeyType));
+}
+
+TVM_REGISTER_GLOBAL("tvm.contrib.thrust.topk_by_key")
+.set_body([](TVMArgs args, TVMRetValue* ret) {
+  ICHECK_GE(args.num_args, 6);
+  DLTensor* keys_in = args[0];
+  DLTensor* values_in = args[1];
+  DLTensor* keys_out = args[2];
+  DLTensor* values_out = args[3];
+  int k = args[4];
+  bool is_ascend = args[5];
+
+  auto key_dtype = DLDataType2String(keys_in->dtype);
+  auto value_dtype = DLDataType2String(values_in->dtype);
+
+  if (key_dtype == "int32") {
+    if (value_dtype == "int32") {
+      thrust_topk_by_key<int, int>(keys_in, values_in, keys_out, values_out, k, is_ascend);
+    } else if (value_dtype == "int64") {
+      thrust_topk_by_key<int, int64_t>(keys_in, values_in, keys_out, values_out, k, is_ascend);
+    } else if (value_dtype == "float32") {
+      thrust_topk_by_key<int, float>(keys_in, values_in, keys_out, values_out, k, is_ascend);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else if (key_dtype == "int64") {
+    if (value_dtype == "int32") {
+      thrust_topk_by_key<int64_t, int>(keys_in, values_in, keys_out, values_out, k, is_ascend);
+    } else if (value_dtype == "int64") {
+      thrust_topk_by_key<int64_t, int64_t>(keys_in, values_in, keys_out, values_out, k,
+                                           is_ascend);
+    } else if (value_dtype == "float32") {
+      thrust_topk_by_key<int64_t, float>(keys_in, values_in, keys_out, values_out, k, is_ascend);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else if (key_dtype == "float32") {
+    if (value_dtype == "int32") {
+      thrust_topk_by_key<float, int>(keys_in, values_in, keys_out, values_out, k, is_ascend);
+    } else if (value_dtype == "int64") {
+      thrust_topk_by_key<float, int64_t>(keys_in, values_in, keys_out, values_out, k, is_ascend);
+    } else if (value_dtype == "float32") {
+      thrust_topk_by_key<float, float>(keys_in, values_in, keys_out, values_out, k, is_ascend);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else {
+    LOG(FATAL) << "Unsupported key dtype: " << key_dtype;
+  }
+});
+
+// Monomorphized entries: the symbol name encodes the (key, value) dtype pair
+// so the fast path carries no runtime type switch.  The generic
+// stable_sort_by_key entry stays as the fallback for dtype pairs without a
+// specialization.
+#define TVM_THRUST_REGISTER_SORT_BY_KEY(KeyType, ValueType, Suffix)             \
+  TVM_REGISTER_GLOBAL("tvm.contrib.thrust.stable_sort_by_key_" Suffix)          \
+  .set_body([](TVMArgs args, TVMRetValue* ret) {                                \
+    ICHECK_GE(args.num_args, 5);                                                \
+    bool check_sorted = args.num_args > 5 ? static_cast<bool>(args[5]) : false; \
+    thrust_stable_sort_by_key<KeyType, ValueType>(args[0], args[1], args[2],    \
+                                                  args[3], args[4], check_sorted); \
+  });
+
+TVM_THRUST_REGISTER_SORT_BY_KEY(int, int, "i32_i32")
+TVM_THRUST_REGISTER_SORT_BY_KEY(int, int64_t, "i32_i64")
+TVM_THRUST_REGISTER_SORT_BY_KEY(int, float, "i32_f32")
+TVM_THRUST_REGISTER_SORT_BY_KEY(int64_t, int, "i64_i32")
+TVM_THRUST_REGISTER_SORT_BY_KEY(int64_t, int64_t, "i64_i64")
+TVM_THRUST_REGISTER_SORT_BY_KEY(int64_t, float, "i64_f32")
+TVM_THRUST_REGISTER_SORT_BY_KEY(float, int, "f32_i32")
+TVM_THRUST_REGISTER_SORT_BY_KEY(float, int64_t, "f32_i64")
+TVM_THRUST_REGISTER_SORT_BY_KEY(float, float, "f32_f32")
+
+#undef TVM_THRUST_REGISTER_SORT_BY_KEY
+
+TVM_REGISTER_GLOBAL("tvm.contrib.thrust.stable_segmented_sort_by_key")
+.set_body([](TVMArgs args, TVMRetValue* ret) {
+  ICHECK_GE(args.num_args, 5);
+  DLTensor* keys_in = args[0];
+  DLTensor* values_in = args[1];
+  DLTensor* segment_ids = args[2];
+  DLTensor* keys_out = args[3];
+  DLTensor* values_out = args[4];
+
+  auto key_dtype = DLDataType2String(keys_in->dtype);
+  auto value_dtype = DLDataType2String(values_in->dtype);
+  ICHECK_EQ(DLDataType2String(segment_ids->dtype), "int32")
+      << "segment ids must be int32";
+
+  if (key_dtype == "int32") {
+    if (value_dtype == "int32") {
+      thrust_stable_segmented_sort_by_key<int, int>(keys_in, values_in, segment_ids,
+                                                    keys_out, values_out);
+    } else if (value_dtype == "int64") {
+      thrust_stable_segmented_sort_by_key<int, int64_t>(keys_in, values_in, segment_ids,
+                                                        keys_out, values_out);
+    } else if (value_dtype == "float32") {
+      thrust_stable_segmented_sort_by_key<int, float>(keys_in, values_in, segment_ids,
+                                                      keys_out, values_out);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else if (key_dtype == "int64") {
+    if (value_dtype == "int32") {
+      thrust_stable_segmented_sort_by_key<int64_t, int>(keys_in, values_in, segment_ids,
+                                                        keys_out, values_out);
+    } else if (value_dtype == "int64") {
+      thrust_stable_segmented_sort_by_key<int64_t, int64_t>(keys_in, values_in, segment_ids,
+                                                            keys_out, values_out);
+    } else if (value_dtype == "float32") {
+      thrust_stable_segmented_sort_by_key<int64_t, float>(keys_in, values_in, segment_ids,
+                                                          keys_out, values_out);
+    } else {
+      LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
+    }
+  } else if (key_dtype == "float32") {
+    if (value_dtype == "int32") {
+      thrust_stable_segmented_sort_by_key<float, int>(keys_in, values_in, segment_ids,
+                                                      keys_out, values_out);
+    } else if (value_dtype == "int64") {
+      thrust_stable_segmented_sort_by_key<float, int64_t>(keys_in, values_in, segment_ids,
+                                                          keys_out, values_out);
+    } else if (value_dtype == "float32") {
+      thrust_stable_segmented_sort_by_key<float, float>(keys_in, values_in, segment_ids,
+                                                        keys_out, values_out);
     } else {
       LOG(FATAL) << "Unsupported value dtype: " << value_dtype;
     }
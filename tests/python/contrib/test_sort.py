@@ -17,10 +17,35 @@
 import tvm
 import tvm.testing
 from tvm import te
-from tvm.topi.cuda import stable_sort_by_key_thrust, is_thrust_available
+from tvm.topi.cuda import (
+    is_cub_available,
+    is_thrust_available,
+    schedule_sort,
+    sort_indices_then_gather,
+    sort_then_scatter_thrust,
+    stable_argsort_thrust,
+    stable_segmented_sort_by_key_thrust,
+    stable_sort_by_key_cub,
+    stable_sort_by_key_thrust,
+    stable_sort_rows_by_key_thrust,
+    topk_by_key_thrust,
+)
+from tvm.topi.utils import get_const_tuple
 import numpy as np
 
 
+def build_and_run_sort(inputs, outputs, np_inputs):
+    """Build a sort graph for cuda with the sort schedule and run it."""
+    ctx = tvm.gpu(0)
+    with tvm.target.Target("cuda"):
+        s = schedule_sort(outputs)
+    f = tvm.build(s, inputs + outputs, "cuda")
+    args = [tvm.nd.array(a, ctx) for a in np_inputs]
+    args += [tvm.nd.array(np.zeros(get_const_tuple(t.shape), t.dtype), ctx) for t in outputs]
+    f(*args)
+    return [a.asnumpy() for a in args[len(np_inputs) :]]
+
+
 def test_sort():
     n = 2
     l = 5
@@ -123,7 +148,235 @@ def test_thrust_stable_sort_by_key():
     tvm.testing.assert_allclose(values_out.asnumpy(), ref_values_out, rtol=1e-5)
 
 
+def test_thrust_stable_argsort():
+    if not is_thrust_available():
+        print("skip because thrust is not enabled...")
+        return
+
+    size = 100
+    keys = te.placeholder((size,), name="keys", dtype="float32")
+    keys_out, perm_out = stable_argsort_thrust(keys)
+
+    # duplicate keys exercise the stability of the permutation
+    keys_np = np.random.choice(np.arange(10).astype("float32"), size)
+    ref_perm = np.argsort(keys_np, kind="stable")
+    keys_res, perm_res = build_and_run_sort([keys], [keys_out, perm_out], [keys_np])
+    tvm.testing.assert_allclose(keys_res, keys_np[ref_perm], rtol=1e-5)
+    tvm.testing.assert_allclose(perm_res, ref_perm.astype("int32"), rtol=1e-5)
+
+
+def test_thrust_stable_segmented_sort_by_key():
+    if not is_thrust_available():
+        print("skip because thrust is not enabled...")
+        return
+
+    size, nseg = 120, 6
+    seg_len = size // nseg
+    keys = te.placeholder((size,), name="keys", dtype="float32")
+    values = te.placeholder((size,), name="values", dtype="int32")
+    segment_ids = te.placeholder((size,), name="segment_ids", dtype="int32")
+    keys_out, values_out = stable_segmented_sort_by_key_thrust(keys, values, segment_ids)
+
+    keys_np = np.random.choice(np.arange(10).astype("float32"), size)
+    values_np = np.arange(size).astype("int32")
+    seg_np = np.repeat(np.arange(nseg), seg_len).astype("int32")
+    order = [np.argsort(keys_np[seg_np == i], kind="stable") for i in range(nseg)]
+    ref_keys = np.concatenate([keys_np[seg_np == i][order[i]] for i in range(nseg)])
+    ref_values = np.concatenate([values_np[seg_np == i][order[i]] for i in range(nseg)])
+    keys_res, values_res = build_and_run_sort(
+        [keys, values, segment_ids], [keys_out, values_out], [keys_np, values_np, seg_np]
+    )
+    tvm.testing.assert_allclose(keys_res, ref_keys, rtol=1e-5)
+    tvm.testing.assert_allclose(values_res, ref_values, rtol=1e-5)
+
+
+def test_cub_stable_sort_by_key():
+    if not is_cub_available():
+        print("skip because cub is not enabled...")
+        return
+
+    size = 200
+    for end_bit in [0, 4]:
+        keys = te.placeholder((size,), name="keys", dtype="int32")
+        values = te.placeholder((size,), name="values", dtype="int32")
+        # keys fit in 4 bits, so the restricted bit range must still order
+        # them totally
+        keys_out, values_out = stable_sort_by_key_cub(keys, values, end_bit=end_bit)
+
+        keys_np = np.random.randint(0, 16, size=(size,)).astype("int32")
+        values_np = np.arange(size).astype("int32")
+        ref_order = np.argsort(keys_np, kind="stable")
+        keys_res, values_res = build_and_run_sort(
+            [keys, values], [keys_out, values_out], [keys_np, values_np]
+        )
+        tvm.testing.assert_allclose(keys_res, keys_np[ref_order], rtol=1e-5)
+        tvm.testing.assert_allclose(values_res, values_np[ref_order], rtol=1e-5)
+
+
+def test_cub_block_sort_by_key_routing():
+    if not is_thrust_available() or not is_cub_available():
+        print("skip because thrust or cub is not enabled...")
+        return
+
+    # 4096 is the largest static size routed to the single-CTA block sort;
+    # 4097 must fall back to the device-wide thrust path
+    for size in [33, 4096, 4097]:
+        keys = te.placeholder((size,), name="keys", dtype="int32")
+        values = te.placeholder((size,), name="values", dtype="int32")
+        keys_out, values_out = stable_sort_by_key_thrust(keys, values)
+
+        keys_np = np.random.permutation(size).astype("int32")
+        values_np = np.random.randint(0, 10, size=(size,)).astype("int32")
+        ref_order = np.argsort(keys_np, kind="stable")
+        keys_res, values_res = build_and_run_sort(
+            [keys, values], [keys_out, values_out], [keys_np, values_np]
+        )
+        tvm.testing.assert_allclose(keys_res, keys_np[ref_order], rtol=1e-5)
+        tvm.testing.assert_allclose(values_res, values_np[ref_order], rtol=1e-5)
+
+    # the for_scatter fixup runs inside the block kernel
+    size = 128
+    keys = te.placeholder((size,), name="keys", dtype="int32")
+    values = te.placeholder((size,), name="values", dtype="int32")
+    keys_out, values_out = stable_sort_by_key_thrust(keys, values, for_scatter=True)
+
+    keys_np = np.random.permutation(size).astype("int32")
+    keys_np[keys_np % 3 == 0] -= size
+    values_np = np.arange(size).astype("int32")
+    fixed_keys = np.where(keys_np < 0, keys_np + size, keys_np)
+    ref_order = np.argsort(fixed_keys, kind="stable")
+    keys_res, values_res = build_and_run_sort(
+        [keys, values], [keys_out, values_out], [keys_np, values_np]
+    )
+    tvm.testing.assert_allclose(keys_res, fixed_keys[ref_order], rtol=1e-5)
+    tvm.testing.assert_allclose(values_res, values_np[ref_order], rtol=1e-5)
+
+
+def test_thrust_stable_sort_rows_by_key():
+    if not is_thrust_available():
+        print("skip because thrust is not enabled...")
+        return
+
+    rows, cols = 5, 31
+    for key_dtype in ["float32", "int32"]:
+        for is_ascend in [1, 0]:
+            keys = te.placeholder((rows, cols), name="keys", dtype=key_dtype)
+            values = te.placeholder((rows, cols), name="values", dtype="int32")
+            keys_out, values_out = stable_sort_rows_by_key_thrust(keys, values, is_ascend)
+
+            keys_np = np.random.randint(-50, 50, size=(rows, cols)).astype(key_dtype)
+            values_np = np.arange(rows * cols).astype("int32").reshape(rows, cols)
+            order_np = keys_np if is_ascend else -keys_np
+            ref_order = np.argsort(order_np, axis=1, kind="stable")
+            ref_keys = np.take_along_axis(keys_np, ref_order, axis=1)
+            ref_values = np.take_along_axis(values_np, ref_order, axis=1)
+            keys_res, values_res = build_and_run_sort(
+                [keys, values], [keys_out, values_out], [keys_np, values_np]
+            )
+            tvm.testing.assert_allclose(keys_res, ref_keys, rtol=1e-5)
+            tvm.testing.assert_allclose(values_res, ref_values, rtol=1e-5)
+
+
+def test_thrust_sort_then_scatter():
+    if not is_thrust_available():
+        print("skip because thrust is not enabled...")
+        return
+
+    n, ni = 50, 20
+    data = te.placeholder((n,), name="data", dtype="float32")
+    indices = te.placeholder((ni,), name="indices", dtype="int32")
+    updates = te.placeholder((ni,), name="updates", dtype="float32")
+    out = sort_then_scatter_thrust(data, indices, updates)
+
+    data_np = np.random.uniform(size=(n,)).astype("float32")
+    # duplicates check that the last update wins, negatives the fixup
+    indices_np = np.random.randint(-n, n, size=(ni,)).astype("int32")
+    indices_np[3] = indices_np[7] = indices_np[12]
+    updates_np = np.random.uniform(size=(ni,)).astype("float32")
+    ref = data_np.copy()
+    for i, u in zip(indices_np, updates_np):
+        ref[int(i)] = u
+    (res,) = build_and_run_sort([data, indices, updates], [out], [data_np, indices_np, updates_np])
+    tvm.testing.assert_allclose(res, ref, rtol=1e-5)
+
+
+def test_thrust_topk_by_key():
+    if not is_thrust_available():
+        print("skip because thrust is not enabled...")
+        return
+
+    n, k = 100, 10
+    for is_ascend in [0, 1]:
+        keys = te.placeholder((n,), name="keys", dtype="float32")
+        values = te.placeholder((n,), name="values", dtype="int32")
+        keys_out, values_out = topk_by_key_thrust(keys, values, k, is_ascend)
+
+        keys_np = np.random.permutation(n).astype("float32")
+        values_np = np.arange(n).astype("int32")
+        ref_order = np.argsort(keys_np if is_ascend else -keys_np, kind="stable")[:k]
+        keys_res, values_res = build_and_run_sort(
+            [keys, values], [keys_out, values_out], [keys_np, values_np]
+        )
+        tvm.testing.assert_allclose(keys_res, keys_np[ref_order], rtol=1e-5)
+        tvm.testing.assert_allclose(values_res, values_np[ref_order], rtol=1e-5)
+
+
+def test_thrust_sort_indices_then_gather():
+    if not is_thrust_available():
+        print("skip because thrust is not enabled...")
+        return
+
+    n = 60
+    keys = te.placeholder((n,), name="keys", dtype="float32")
+    scores = te.placeholder((n,), name="scores", dtype="int32")
+    boxes = te.placeholder((n, 4), name="boxes", dtype="float32")
+    keys_out, (scores_out, boxes_out) = sort_indices_then_gather(keys, [scores, boxes])
+
+    keys_np = np.random.permutation(n).astype("float32")
+    scores_np = np.random.randint(0, 10, size=(n,)).astype("int32")
+    boxes_np = np.random.uniform(size=(n, 4)).astype("float32")
+    ref_order = np.argsort(keys_np, kind="stable")
+    keys_res, scores_res, boxes_res = build_and_run_sort(
+        [keys, scores, boxes], [keys_out, scores_out, boxes_out], [keys_np, scores_np, boxes_np]
+    )
+    tvm.testing.assert_allclose(keys_res, keys_np[ref_order], rtol=1e-5)
+    tvm.testing.assert_allclose(scores_res, scores_np[ref_order], rtol=1e-5)
+    tvm.testing.assert_allclose(boxes_res, boxes_np[ref_order], rtol=1e-5)
+
+
+def test_thrust_sort_by_key_assume_sorted():
+    if not is_thrust_available():
+        print("skip because thrust is not enabled...")
+        return
+
+    size = 8
+    keys = te.placeholder((size,), name="keys", dtype="int32")
+    values = te.placeholder((size,), name="values", dtype="int32")
+    keys_out, values_out = stable_sort_by_key_thrust(
+        keys, values, for_scatter=True, assume_sorted=True
+    )
+
+    # sorted only after the negative indices are converted, so the fixup
+    # must still run in the lowered copies
+    keys_np = np.array([-8, -7, -6, 3, 4, 5, 6, 7], np.int32)
+    values_np = np.random.randint(0, 10, size=(size,)).astype(np.int32)
+    keys_res, values_res = build_and_run_sort(
+        [keys, values], [keys_out, values_out], [keys_np, values_np]
+    )
+    tvm.testing.assert_allclose(keys_res, np.where(keys_np < 0, keys_np + size, keys_np))
+    tvm.testing.assert_allclose(values_res, values_np)
+
+
 if __name__ == "__main__":
     test_sort()
     test_sort_np()
     test_thrust_stable_sort_by_key()
+    test_thrust_stable_argsort()
+    test_thrust_stable_segmented_sort_by_key()
+    test_cub_stable_sort_by_key()
+    test_cub_block_sort_by_key_routing()
+    test_thrust_stable_sort_rows_by_key()
+    test_thrust_sort_then_scatter()
+    test_thrust_topk_by_key()
+    test_thrust_sort_indices_then_gather()
+    test_thrust_sort_by_key_assume_sorted()
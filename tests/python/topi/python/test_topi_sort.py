@@ -39,8 +39,7 @@ _topk_implement = {
 }
 
 
-def verify_sort(axis, is_ascend):
-    dshape = (20, 100)
+def verify_sort(axis, is_ascend, dshape=(20, 100)):
     data_dtype = "float32"
     data = te.placeholder(dshape, name="data", dtype=data_dtype)
 
@@ -79,8 +78,7 @@ def verify_sort(axis, is_ascend):
         check_device(device)
 
 
-def verify_argsort(axis, is_ascend):
-    dshape = (20, 100)
+def verify_argsort(axis, is_ascend, dshape=(20, 100)):
     data_dtype = "float32"
     data = te.placeholder(dshape, name="data", dtype=data_dtype)
 
@@ -177,6 +175,10 @@ def test_sort():
     for axis in [0, -1, 1]:
         verify_sort(axis, True)
         verify_sort(axis, False)
+    # axes longer than one merge block (8192 elements at 1024 threads)
+    # exercise the staged-key merge path across block boundaries
+    verify_sort(-1, True, dshape=(2, 10000))
+    verify_sort(-1, False, dshape=(2, 10000))
 
 
 @tvm.testing.uses_gpu
@@ -185,6 +187,7 @@ def test_argsort():
     for axis in [0, -1, 1]:
         verify_argsort(axis, True)
         verify_argsort(axis, False)
+    verify_argsort(-1, True, dshape=(2, 10000))
 
 
 @tvm.testing.uses_gpu